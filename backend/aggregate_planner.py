@@ -0,0 +1,253 @@
+# generic group-by queries for /aggregate
+#
+# instead of a new endpoint (and a new full scan) for every chart, the
+# frontend can ask for any mix of dimensions + metrics, e.g.
+#   /aggregate?group_by=hour,borough&metrics=count,avg_fare,sum_tip&filter=borough:Manhattan
+#
+# the planner picks where to answer it from:
+#   - "cube": an in-memory rollup of every trip grouped by
+#     (pickup_hour, pickup_zone_id, payment_type). borough comes from the
+#     zone so it is covered too. thats ~24 * 265 * 5 cells, so re-grouping it
+#     takes milliseconds instead of a table scan
+#   - "sql": anything the cube cant answer (dropoff zone, date, ...) goes to
+#     sql, run through the parallel scanner
+# and the response says which one it used.
+
+from parallel_scan import PartialAggregate
+
+# name -> sql expression, and whether the cube can answer it
+DIMENSIONS = {
+    'hour': {'sql': 't.pickup_hour', 'cube': True},
+    'zone': {'sql': 't.pickup_zone_id', 'cube': True},
+    'borough': {'sql': 'z.borough', 'cube': True},
+    'payment_type': {'sql': 't.payment_type', 'cube': True},
+    'dropoff_zone': {'sql': 't.dropoff_zone_id', 'cube': False},
+    'date': {'sql': 'substr(t.pickup_datetime, 1, 10)', 'cube': False},
+    'passenger_count': {'sql': 't.passenger_count', 'cube': False}
+}
+
+# dimensions stored in each cube cell key, in this order
+CUBE_DIMENSIONS = ['hour', 'zone', 'payment_type']
+
+# numeric dimensions get their filter values converted to int
+INT_DIMENSIONS = {'hour', 'zone', 'payment_type', 'dropoff_zone', 'passenger_count'}
+
+# trip columns the metrics are built from (the cube keeps count/sum/min/max of each)
+MEASURES = {
+    'fare': 't.fare_amount',
+    'tip': 't.tip_amount',
+    'distance': 't.trip_distance',
+    'total': 't.total_amount',
+    'duration': 't.trip_duration_minutes',
+    'fare_per_mile': 't.fare_per_mile'
+}
+
+# metric name -> (measure, function). count has no measure
+METRICS = {'count': (None, 'count')}
+for _measure in MEASURES:
+    for _func in ('avg', 'sum', 'min', 'max'):
+        METRICS[f'{_func}_{_measure}'] = (_measure, _func)
+
+DEFAULT_METRICS = ['count', 'avg_fare']
+
+
+def parse_list(value):
+    """'a, b,c' -> ['a', 'b', 'c']"""
+    if not value:
+        return []
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def parse_filters(value):
+    """
+    'borough:Manhattan,hour:8|9' -> {'borough': ['Manhattan'], 'hour': [8, 9]}
+
+    | separates values that are ORed together
+    """
+    filters = {}
+    for part in parse_list(value):
+        if ':' not in part:
+            raise ValueError(f"bad filter '{part}', use dimension:value")
+        dim, raw_values = part.split(':', 1)
+        dim = dim.strip()
+        if dim not in DIMENSIONS:
+            raise ValueError(f"unknown filter dimension '{dim}'")
+
+        values = [v.strip() for v in raw_values.split('|') if v.strip()]
+        if not values:
+            raise ValueError(f"filter '{dim}' has no values")
+        if dim in INT_DIMENSIONS:
+            try:
+                values = [int(v) for v in values]
+            except ValueError:
+                raise ValueError(f"filter '{dim}' needs whole numbers")
+        filters[dim] = values
+    return filters
+
+
+def finish_metric(metric, group):
+    """turn the merged partials for one group into the metric value"""
+    measure, func = METRICS[metric]
+    if func == 'count':
+        return group['rows']
+
+    partial = group[measure]
+    if func == 'avg':
+        value = partial.avg
+    elif func == 'sum':
+        value = partial.sum if partial.count else None
+    elif func == 'min':
+        value = partial.min
+    else:
+        value = partial.max
+    return round(value, 2) if value is not None else None
+
+
+def sort_key(key):
+    # None (e.g. zone with no borough) sorts last instead of crashing
+    return tuple((v is None, v) for v in key)
+
+
+class Cube:
+    """
+    rollup of all trips by (hour, zone, payment_type)
+
+    cells: {(hour, zone, payment_type): {"rows": n, measure: PartialAggregate}}
+    zone_boroughs: {zone_id: borough}
+    """
+
+    def __init__(self, cells, zone_boroughs):
+        self.cells = cells
+        self.zone_boroughs = zone_boroughs
+
+    @classmethod
+    def build(cls, scanner, zone_boroughs):
+        """one (parallel) scan of the trips table"""
+        columns = list(MEASURES.values())
+        groups = scanner.aggregate(columns, group_by=[DIMENSIONS[d]['sql'] for d in CUBE_DIMENSIONS])
+
+        cells = {}
+        for key, group in groups.items():
+            cell = {"rows": group["rows"]}
+            for measure, column in MEASURES.items():
+                cell[measure] = group[column]
+            cells[key] = cell
+        return cls(cells, zone_boroughs)
+
+    def dimension_value(self, dim, key):
+        if dim == 'borough':
+            return self.zone_boroughs.get(key[1])
+        return key[CUBE_DIMENSIONS.index(dim)]
+
+    def query(self, group_by, filters, measures):
+        """re-group the cube cells, returns {group_key: {"rows":.., measure: PartialAggregate}}"""
+        results = {}
+        for key, cell in self.cells.items():
+            if any(self.dimension_value(dim, key) not in values for dim, values in filters.items()):
+                continue
+
+            group_key = tuple(self.dimension_value(dim, key) for dim in group_by)
+            if group_key not in results:
+                results[group_key] = {"rows": 0}
+                for measure in measures:
+                    results[group_key][measure] = PartialAggregate()
+
+            group = results[group_key]
+            group["rows"] += cell["rows"]
+            for measure in measures:
+                part = cell[measure]
+                group[measure].merge(part.count, part.sum, part.min, part.max)
+        return results
+
+
+class AggregatePlanner:
+    """
+    answers /aggregate requests from the cube when it can, sql otherwise
+
+    scanner: ParallelScanner for the sql path
+    get_cube: function returning the (cached) Cube
+    """
+
+    def __init__(self, scanner, get_cube):
+        self.scanner = scanner
+        self.get_cube = get_cube
+
+    def plan(self, group_by, filters):
+        """'cube' if every dimension used is in the cube, else 'sql'"""
+        used = set(group_by) | set(filters)
+        if all(DIMENSIONS[dim]['cube'] for dim in used):
+            return 'cube'
+        return 'sql'
+
+    def run_sql(self, group_by, filters, measures):
+        conditions = []
+        params = []
+        for dim, values in filters.items():
+            placeholders = ', '.join('?' for _ in values)
+            conditions.append(f"{DIMENSIONS[dim]['sql']} IN ({placeholders})")
+            params.extend(values)
+
+        used = set(group_by) | set(filters)
+        columns = [MEASURES[m] for m in measures]
+        groups = self.scanner.aggregate(
+            columns,
+            where=' AND '.join(conditions),
+            params=params,
+            group_by=[DIMENSIONS[dim]['sql'] for dim in group_by],
+            join_zones='borough' in used
+        )
+
+        # rename sql column keys back to measure names
+        results = {}
+        for key, group in groups.items():
+            results[key] = {"rows": group["rows"]}
+            for measure, column in zip(measures, columns):
+                results[key][measure] = group[column]
+        return results
+
+    def aggregate(self, group_by, metrics, filters):
+        """
+        run one aggregate request
+
+        group_by: list of dimension names
+        metrics: list of metric names
+        filters: {dimension: [values]}
+
+        returns {"source":.., "group_by":.., "metrics":.., "filters":.., "rows": [...]}
+        raises ValueError for unknown dimensions/metrics
+        """
+        for dim in group_by:
+            if dim not in DIMENSIONS:
+                raise ValueError(f"unknown group_by dimension '{dim}', use: {', '.join(DIMENSIONS)}")
+        for metric in metrics:
+            if metric not in METRICS:
+                raise ValueError(f"unknown metric '{metric}', use: {', '.join(METRICS)}")
+
+        measures = []
+        for metric in metrics:
+            measure = METRICS[metric][0]
+            if measure and measure not in measures:
+                measures.append(measure)
+
+        source = self.plan(group_by, filters)
+        if source == 'cube':
+            groups = self.get_cube().query(group_by, filters, measures)
+        else:
+            groups = self.run_sql(group_by, filters, measures)
+
+        rows = []
+        for key in sorted(groups, key=sort_key):
+            if groups[key]["rows"] == 0:
+                continue  # sql returns one all-zero row when nothing matches
+            row = dict(zip(group_by, key))
+            for metric in metrics:
+                row[metric] = finish_metric(metric, groups[key])
+            rows.append(row)
+
+        return {
+            "source": source,
+            "group_by": group_by,
+            "metrics": metrics,
+            "filters": filters,
+            "rows": rows
+        }
@@ -2,20 +2,45 @@
 # kevin did most of this
 # basically just connects to the database and returns json
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import sqlite3
 import os
 import sys
+import hashlib
+import json
+import threading
+from datetime import datetime
 
 # need this so python can find our algorithm file
 sys.path.insert(0, os.path.dirname(__file__))
 from algorithms.top_zones import get_top_n_zones
+from zone_map import RAW_GEOJSON_PATH, SIMPLIFIED_GEOJSON_PATH, load_simplified_geometry, build_zone_map_payload
+from encoding import (available_encodings, choose_encoding, choose_format, compress_body,
+                      compress_response, dumps_json, encode_rows)
+from warmup import WarmupState, start_warmup
+from parallel_scan import ParallelScanner
+from aggregate_planner import AggregatePlanner, Cube, DEFAULT_METRICS, parse_filters, parse_list
+from live_windows import LiveAggregates, RING_SIZE
+from export import EXPORT_FORMATS, csv_stream, fetch_chunks, parquet_stream
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # jsonify goes through here - use orjson when its installed
+    def dumps(self, obj, **kwargs):
+        return dumps_json(obj).decode('utf-8')
+
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)  # so frontend can talk to us
 
-DATABASE_PATH = os.path.join(os.path.dirname(__file__), '..', 'database', 'taxi_data.db')
+# TAXI_DATABASE_PATH lets the load tests point the api at a fixture database
+DATABASE_PATH = os.environ.get(
+    'TAXI_DATABASE_PATH',
+    os.path.join(os.path.dirname(__file__), '..', 'database', 'taxi_data.db')
+)
 
 
 def get_db_connection():
@@ -27,6 +52,135 @@ def get_db_connection():
     return conn
 
 
+# big aggregates get split across threads (TAXI_SCAN_WORKERS, default = cpu cores)
+scanner = ParallelScanner(DATABASE_PATH)
+
+
+# dashboard responses only change when the database file changes, so keep
+# them in memory keyed by the db mtime. the warm-up thread fills this on start
+_response_cache = {"version": None, "entries": {}}
+_response_cache_lock = threading.Lock()
+
+# TAXI_DISABLE_RESPONSE_CACHE=1 makes every dashboard request run its query -
+# the load tests use it to measure the scans themselves, not just dict -> json.
+# lookups the api builds on (the cube, zone boroughs) stay cached either way
+RESPONSE_CACHE_ENABLED = os.environ.get('TAXI_DISABLE_RESPONSE_CACHE') != '1'
+
+
+def get_cached(key, compute, response=True):
+    # returns the cached value for key, or runs compute() and stores it
+    # response=False for internal lookups that TAXI_DISABLE_RESPONSE_CACHE shouldnt touch
+    if response and not RESPONSE_CACHE_ENABLED:
+        return compute()
+
+    version = os.path.getmtime(DATABASE_PATH) if os.path.exists(DATABASE_PATH) else None
+
+    with _response_cache_lock:
+        if _response_cache["version"] != version:
+            _response_cache["version"] = version
+            _response_cache["entries"] = {}
+        if key in _response_cache["entries"]:
+            return _response_cache["entries"][key]
+
+    value = compute()
+
+    with _response_cache_lock:
+        if _response_cache["version"] == version:
+            _response_cache["entries"][key] = value
+    return value
+
+
+def get_zone_boroughs():
+    # {zone_id: borough}, small so just cache it
+    def load():
+        conn = get_db_connection()
+        zone_boroughs = {row["zone_id"]: row["borough"] for row in conn.execute("SELECT zone_id, borough FROM zones")}
+        conn.close()
+        return zone_boroughs
+
+    return get_cached(('zone_boroughs',), load, response=False)
+
+
+def build_cube():
+    # rollup used by /aggregate - one parallel scan, then cached like the rest
+    return Cube.build(scanner, get_zone_boroughs())
+
+
+planner = AggregatePlanner(scanner, lambda: get_cached(('cube',), build_cube, response=False))
+
+
+# zone map payload is the same for everyone until the database changes,
+# so we build it once and keep the json + compressed bytes in memory.
+# bodies and etags are keyed by content encoding (None = uncompressed) -
+# each encoding is a different representation so it gets its own etag
+_zone_map_cache = {"key": None, "bodies": {}, "etags": {}}
+_zone_map_lock = threading.Lock()
+
+
+def zone_map_cache_key():
+    # mtimes only - cheap enough to check on every request (including 304s)
+    def mtime(path):
+        return os.path.getmtime(path) if os.path.exists(path) else None
+    return (mtime(DATABASE_PATH), mtime(SIMPLIFIED_GEOJSON_PATH), mtime(RAW_GEOJSON_PATH))
+
+
+def get_zone_map_payload():
+    # rebuilds only when the database, the simplified geometry or the raw
+    # geojson changes. everything happens under the lock so two requests
+    # cant rebuild (and write the same .tmp file) at the same time
+    with _zone_map_lock:
+        if _zone_map_cache["key"] == zone_map_cache_key():
+            return _zone_map_cache
+
+        geometry = load_simplified_geometry()
+        # read the key after loading - a rebuild just changed the simplified file
+        cache_key = zone_map_cache_key()
+
+        conn = get_db_connection()
+        rows = conn.execute("""
+            SELECT z.zone_id, z.zone_name, z.borough,
+                   COUNT(t.trip_id) AS trip_count,
+                   AVG(t.fare_amount) AS average_fare,
+                   AVG(t.tip_amount) AS average_tip
+            FROM zones z
+            LEFT JOIN trips t ON t.pickup_zone_id = z.zone_id
+            GROUP BY z.zone_id
+        """).fetchall()
+        conn.close()
+
+        zone_stats = {
+            row["zone_id"]: {
+                "zone_name": row["zone_name"],
+                "borough": row["borough"],
+                "trip_count": row["trip_count"],
+                "average_fare": round(row["average_fare"], 2) if row["average_fare"] else None,
+                "average_tip": round(row["average_tip"], 2) if row["average_tip"] else None
+            }
+            for row in rows
+        }
+
+        payload = build_zone_map_payload(geometry, zone_stats)
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+        digest = hashlib.sha1(body).hexdigest()
+        bodies = {None: body}
+        etags = {None: digest}
+        for encoding in available_encodings():
+            bodies[encoding] = compress_body(body, encoding, best=True)
+            etags[encoding] = f"{digest}-{encoding}"
+
+        _zone_map_cache["key"] = cache_key
+        _zone_map_cache["bodies"] = bodies
+        _zone_map_cache["etags"] = etags
+        return _zone_map_cache
+
+
+@app.after_request
+def compress(response):
+    # gzip/brotli big responses if the client accepts it
+    return compress_response(response, request.headers.get('Accept-Encoding', ''))
+
+
 # ----------------
 # routes
 # ----------------
@@ -40,37 +194,74 @@ def home():
 def get_summary():
     # returns total trips, avg fare, avg distance
     try:
-        conn = get_db_connection()
+        return jsonify(get_cached(('summary',), compute_summary))
 
-        query = """
-            SELECT 
-                COUNT(*) AS total_trips,
-                AVG(fare_amount) AS average_fare,
-                AVG(trip_distance) AS average_distance
-            FROM trips
-        """
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        result = conn.execute(query).fetchone()
-        conn.close()
 
-        return jsonify({
-            "total_trips": result["total_trips"],
-            "average_fare": round(result["average_fare"], 2) if result["average_fare"] else 0,
-            "average_distance": round(result["average_distance"], 2) if result["average_distance"] else 0
-        })
+def compute_summary():
+    # full table scan, so run it in parallel shards
+    result = scanner.aggregate(['fare_amount', 'trip_distance']).get(())
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    if result is None:
+        return {"total_trips": 0, "average_fare": 0, "average_distance": 0}
+
+    average_fare = result['fare_amount'].avg
+    average_distance = result['trip_distance'].avg
+
+    return {
+        "total_trips": result["rows"],
+        "average_fare": round(average_fare, 2) if average_fare else 0,
+        "average_distance": round(average_distance, 2) if average_distance else 0
+    }
+
+
+def build_trip_filters(args):
+    # WHERE conditions shared by /trips and /export
+    # start_date is inclusive, end_date is exclusive (YYYY-MM-DD)
+    conditions = []
+    params = []
+
+    borough = args.get('borough')
+    hour = args.get('hour')
+
+    if borough:
+        conditions.append("z.borough = ?")
+        params.append(borough)
+
+    if hour:
+        conditions.append("t.pickup_hour = ?")
+        params.append(hour)
+
+    for name, op in (('start_date', '>='), ('end_date', '<')):
+        value = args.get(name)
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f"{name} must look like YYYY-MM-DD")
+            conditions.append(f"t.pickup_datetime {op} ?")
+            params.append(value)
+
+    return conditions, params
 
 
 @app.route('/trips')
 def get_trips():
     """
-    GET /trips?borough=<borough>&hour=<hour>
+    GET /trips?borough=<borough>&hour=<hour>&start_date=<date>&end_date=<date>&format=<json|msgpack|arrow>
+
+    json (default) is a list of trip objects. msgpack and arrow are
+    column-oriented and can also be asked for with the Accept header
+    (application/x-msgpack, application/vnd.apache.arrow.stream)
     """
     try:
-        borough = request.args.get('borough')
-        hour = request.args.get('hour')
+        try:
+            fmt = choose_format(request.args, request.accept_mimetypes)
+            conditions, params = build_trip_filters(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         conn = get_db_connection()
 
@@ -80,61 +271,113 @@ def get_trips():
             LEFT JOIN zones z ON t.pickup_zone_id = z.zone_id
             WHERE 1=1
         """
-        params = []
-
-        if borough:
-            query += " AND z.borough = ?"
-            params.append(borough)
-
-        if hour:
-            query += " AND t.pickup_hour = ?"
-            params.append(hour)
+        for condition in conditions:
+            query += " AND " + condition
 
         query += " LIMIT 100"
 
-        rows = conn.execute(query, params).fetchall()
+        # plain tuples are much cheaper than sqlite3.Row -> dict for every row
+        conn.row_factory = None
+        cursor = conn.execute(query, params)
+        columns = [col[0] for col in cursor.description]
+        rows = cursor.fetchall()
         conn.close()
 
-        trips = [dict(row) for row in rows]
+        body, mimetype = encode_rows(columns, rows, fmt)
 
-        return jsonify(trips)
+        response = Response(body, mimetype=mimetype)
+        response.vary.add('Accept')
+        return response
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 
-@app.route('/average-fare-by-hour')
-def get_average_fare_by_hour():
+@app.route('/export')
+def export_trips():
     """
-    GET /average-fare-by-hour
+    GET /export?borough=<borough>&hour=<hour>&start_date=<date>&end_date=<date>&format=<csv|parquet>
+
+    Streams every matching trip (no LIMIT) as a download. Rows are read
+    from the cursor in chunks and sent as they are encoded, so memory use
+    doesnt grow with the size of the export.
     """
     try:
+        fmt = request.args.get('format', default='csv')
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({"error": f"format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+
+        try:
+            conditions, params = build_trip_filters(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # fail before we start streaming if theres no database
         conn = get_db_connection()
+        conn.row_factory = None
+
+        column_types = [row[2] for row in conn.execute("PRAGMA table_info(trips)")]
 
         query = """
-            SELECT pickup_hour, AVG(fare_amount) AS average_fare
-            FROM trips
-            GROUP BY pickup_hour
-            ORDER BY pickup_hour
+            SELECT t.*
+            FROM trips t
+            LEFT JOIN zones z ON t.pickup_zone_id = z.zone_id
+            WHERE 1=1
         """
+        for condition in conditions:
+            query += " AND " + condition
+        query += " ORDER BY t.trip_id"
+
+        cursor = conn.execute(query, params)
+        columns = [col[0] for col in cursor.description]
+
+        def generate():
+            # the connection stays open until the last chunk is sent
+            # (or the client disconnects, which closes the generator)
+            try:
+                chunks = fetch_chunks(cursor)
+                if fmt == 'csv':
+                    yield from csv_stream(columns, chunks)
+                else:
+                    yield from parquet_stream(columns, column_types, chunks)
+            finally:
+                conn.close()
+
+        response = Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[fmt])
+        response.headers['Content-Disposition'] = f'attachment; filename="trips_export.{fmt}"'
+        return response
 
-        rows = conn.execute(query).fetchall()
-        conn.close()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        results = [
-            {
-                "hour": row["pickup_hour"],
-                "average_fare": round(row["average_fare"], 2)
-            }
-            for row in rows
-        ]
 
-        return jsonify(results)
+@app.route('/average-fare-by-hour')
+def get_average_fare_by_hour():
+    """
+    GET /average-fare-by-hour
+    """
+    try:
+        return jsonify(get_cached(('average_fare_by_hour',), compute_average_fare_by_hour))
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+def compute_average_fare_by_hour():
+    # AVG(fare_amount) needs every row, so same as summary - parallel shards
+    groups = scanner.aggregate(['fare_amount'], group_by=['t.pickup_hour'])
+
+    results = []
+    for (hour,) in sorted(groups):
+        average_fare = groups[(hour,)]['fare_amount'].avg
+        results.append({
+            "hour": hour,
+            "average_fare": round(average_fare, 2) if average_fare is not None else 0
+        })
+    return results
+
+
 @app.route('/top-zones')
 def get_top_zones():
     """
@@ -145,32 +388,223 @@ def get_top_zones():
     try:
         n = request.args.get('n', default=10, type=int)
 
-        conn = get_db_connection()
+        return jsonify(get_cached(('top_zones', n), lambda: compute_top_zones(n)))
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        #  Fetch RAW pickup_zone_id only (no aggregation)
-        query = "SELECT pickup_zone_id FROM trips"
 
-        rows = conn.execute(query).fetchall()
-        conn.close()
+def compute_top_zones(n):
+    conn = get_db_connection()
 
-        # Convert rows into algorithm-friendly format (tuple structure)
-        trip_data = [(row["pickup_zone_id"],) for row in rows]
+    #  Fetch RAW pickup_zone_id only (no aggregation)
+    query = "SELECT pickup_zone_id FROM trips"
 
-        # Using Michaella's manual algorithm for counting + sorting
-        top_zones = get_top_n_zones(trip_data, n)
+    rows = conn.execute(query).fetchall()
+    conn.close()
+
+    # Convert rows into algorithm-friendly format (tuple structure)
+    trip_data = [(row["pickup_zone_id"],) for row in rows]
+
+    # Using Michaella's manual algorithm for counting + sorting
+    top_zones = get_top_n_zones(trip_data, n)
+
+    return [
+        {
+            "pickup_zone_id": zone_id,
+            "trip_count": count
+        }
+        for zone_id, count in top_zones
+    ]
+
+
+@app.route('/aggregate')
+def get_aggregate():
+    """
+    GET /aggregate?group_by=hour,borough&metrics=count,avg_fare,sum_tip&filter=borough:Manhattan,hour:8|9
+
+    group_by: hour, zone, borough, payment_type, dropoff_zone, date, passenger_count
+    metrics: count, or avg_/sum_/min_/max_ + fare, tip, distance, total, duration, fare_per_mile
+    filter: dimension:value pairs, | between values means OR
+
+    "source" in the response says if it came from the precomputed cube or sql
+    """
+    try:
+        try:
+            group_by = parse_list(request.args.get('group_by'))
+            metrics = parse_list(request.args.get('metrics')) or DEFAULT_METRICS
+            filters = parse_filters(request.args.get('filter'))
+            result = planner.aggregate(group_by, metrics, filters)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# replay mode - see data_processing/replay.py
+# the write endpoints (/live/ingest, /live/reset) have no auth, so they only
+# exist when the backend is started with TAXI_REPLAY_MODE=1
+REPLAY_MODE = os.environ.get('TAXI_REPLAY_MODE') == '1'
+live = LiveAggregates()
+
+
+@app.route('/live')
+def get_live():
+    """
+    GET /live?level=<borough|zone>&window=<minutes>
+    Rolling trip count, revenue and average fare over the last `window`
+    minutes (default 15, max 60) of replayed trips.
+    """
+    try:
+        level = request.args.get('level', default='borough')
+        window = request.args.get('window', default=15, type=int)
+
+        if level not in ('borough', 'zone'):
+            return jsonify({"error": "level must be borough or zone"}), 400
+        if window is None or not 1 <= window <= RING_SIZE:
+            return jsonify({"error": f"window must be between 1 and {RING_SIZE} minutes"}), 400
+
+        return jsonify(live.snapshot(level, window))
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify([
-            {
-                "pickup_zone_id": zone_id,
-                "trip_count": count
-            }
-            for zone_id, count in top_zones
-        ])
+
+def ingest_live():
+    """
+    POST /live/ingest
+    Body (column lists, one entry per trip, in pickup order):
+        {"pickup_time": [epoch seconds], "pickup_zone_id": [...],
+         "fare_amount": [...], "total_amount": [...]}
+    """
+    try:
+        batch = request.get_json(silent=True)
+        columns = ['pickup_time', 'pickup_zone_id', 'fare_amount', 'total_amount']
+
+        if not isinstance(batch, dict) or any(not isinstance(batch.get(col), list) for col in columns):
+            return jsonify({"error": f"body must be json with lists: {', '.join(columns)}"}), 400
+
+        lengths = set(len(batch[col]) for col in columns)
+        if len(lengths) != 1:
+            return jsonify({"error": "all lists must be the same length"}), 400
+
+        added = live.ingest(batch['pickup_time'], batch['pickup_zone_id'],
+                            batch['fare_amount'], batch['total_amount'], get_zone_boroughs())
+
+        return jsonify({"received": lengths.pop(), "added": added})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def reset_live():
+    # clear the windows before starting a new replay
+    live.reset()
+    return jsonify({"status": "ok"})
+
+
+if REPLAY_MODE:
+    app.add_url_rule('/live/ingest', view_func=ingest_live, methods=['POST'])
+    app.add_url_rule('/live/reset', view_func=reset_live, methods=['POST'])
+
+
+@app.route('/zones/map')
+def get_zones_map():
+    """
+    GET /zones/map
+    Returns a geojson FeatureCollection of simplified zone shapes with
+    trip_count, average_fare and average_tip for the choropleth.
+    Sent gzipped (or brotli) when the browser accepts it, with an ETag
+    per encoding so repeat loads get a 304.
+    """
+    try:
+        cached = get_zone_map_payload()
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+        etag = cached["etags"][encoding]
+
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(cached["bodies"][encoding], mimetype='application/geo+json')
+            if encoding is not None:
+                response.headers['Content-Encoding'] = encoding
+
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        return response
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+# ----------------
+# health checks + warm-up
+# ----------------
+
+warmup_state = WarmupState()
+
+
+def warm_zone_map():
+    # no taxi_zones.geojson at all is normal. anything else (broken file)
+    # shows up in /health/ready warnings, see OPTIONAL_WARMUP_JOBS
+    try:
+        get_zone_map_payload()
+    except FileNotFoundError:
+        pass
+
+
+# what the dashboard asks for on page load (see frontend/js/app.js)
+WARMUP_JOBS = [
+    ('summary', lambda: get_cached(('summary',), compute_summary)),
+    ('average_fare_by_hour', lambda: get_cached(('average_fare_by_hour',), compute_average_fare_by_hour)),
+    ('top_zones', lambda: get_cached(('top_zones', 10), lambda: compute_top_zones(10))),
+    ('zone_map', warm_zone_map),
+    ('aggregate_cube', lambda: get_cached(('cube',), build_cube, response=False))
+]
+# a broken geojson/simplified cache only breaks /zones/map, not the api
+OPTIONAL_WARMUP_JOBS = {'zone_map'}
+
+
+@app.route('/health/live')
+def health_live():
+    # process is up and answering - doesnt mean the data is ready
+    return jsonify({"status": "ok"})
+
+
+@app.route('/health/ready')
+def health_ready():
+    # 200 only once the warm-up finished, 503 before that (or if it failed)
+    state = warmup_state.to_dict()
+    if warmup_state.is_ready():
+        return jsonify(state)
+    return jsonify(state), 503
+
+
+def start_background_warmup():
+    start_warmup(warmup_state, DATABASE_PATH, WARMUP_JOBS, OPTIONAL_WARMUP_JOBS)
+
+
+def should_start_warmup():
+    # set TAXI_SKIP_WARMUP=1 to turn it off
+    if os.environ.get('TAXI_SKIP_WARMUP') == '1':
+        return False
+    # `python app.py` runs with the debug reloader, which runs this file in a
+    # watcher process AND in the child that serves requests. only the child
+    # has WERKZEUG_RUN_MAIN set, so skip the full-scan warm-up in the watcher
+    if __name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return False
+    return True
+
+
+# start warming as soon as the app is imported (works for gunicorn too)
+if should_start_warmup():
+    start_background_warmup()
+
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
 
@@ -0,0 +1,191 @@
+# response encoding helpers
+#
+# /trips used to do jsonify([dict(row) for row in rows]) which builds a dict
+# per row and then runs the slow stdlib json encoder over it. this file
+# handles picking a format from the request and turning query results
+# (column names + row tuples) into bytes:
+#   - json (default): same row-of-dicts shape the frontend expects, but
+#     encoded with orjson if its installed
+#   - msgpack: column-oriented {"columns": [...], "data": {col: [values]}}
+#   - arrow: apache arrow IPC stream (column-oriented, typed)
+# plus gzip / brotli compression based on Accept-Encoding.
+#
+# orjson, msgpack and brotli are optional - we fall back to stdlib json and
+# gzip if they arent installed (see requirements.txt)
+
+import gzip
+import io
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+# short names accepted in ?format=
+FORMAT_MIMETYPES = {
+    'json': JSON_MIMETYPE,
+    'msgpack': MSGPACK_MIMETYPE,
+    'arrow': ARROW_MIMETYPE
+}
+
+# dont bother compressing tiny responses, the headers cost more than we save
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def dumps_json(obj):
+    """encode to json bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def available_formats():
+    """formats we can actually produce with whats installed"""
+    formats = ['json', 'arrow']
+    if msgpack is not None:
+        formats.append('msgpack')
+    return formats
+
+
+def choose_format(args, accept_mimetypes):
+    """
+    pick the response format
+
+    ?format=json|msgpack|arrow wins, otherwise look at the Accept header.
+    raises ValueError for a format we cant produce
+    """
+    requested = args.get('format')
+    if requested:
+        if requested not in available_formats():
+            raise ValueError(f"unsupported format '{requested}', use one of: {', '.join(available_formats())}")
+        return requested
+
+    offered = [FORMAT_MIMETYPES[fmt] for fmt in available_formats()]
+    best = accept_mimetypes.best_match(offered, default=JSON_MIMETYPE)
+    for fmt, mimetype in FORMAT_MIMETYPES.items():
+        if mimetype == best:
+            return fmt
+    return 'json'
+
+
+def rows_to_columns(columns, rows):
+    """turn a list of row tuples into {column: [values]}"""
+    if not rows:
+        return {col: [] for col in columns}
+    return {col: list(values) for col, values in zip(columns, zip(*rows))}
+
+
+def encode_rows(columns, rows, fmt='json'):
+    """
+    encode query results in the given format
+
+    columns: list of column names (cursor.description order)
+    rows: list of tuples
+
+    returns (body_bytes, mimetype)
+    """
+    if fmt == 'json':
+        return dumps_json([dict(zip(columns, row)) for row in rows]), JSON_MIMETYPE
+
+    data = rows_to_columns(columns, rows)
+
+    if fmt == 'msgpack':
+        return msgpack.packb({"columns": list(columns), "data": data}), MSGPACK_MIMETYPE
+
+    if fmt == 'arrow':
+        import pyarrow as pa
+
+        table = pa.Table.from_pydict(data)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue(), ARROW_MIMETYPE
+
+    raise ValueError(f"unsupported format '{fmt}'")
+
+
+def accepted_encodings(accept_encoding):
+    """codings listed in Accept-Encoding, minus the ones turned off with q=0"""
+    accepted = []
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding.strip() and quality > 0:
+            accepted.append(coding.strip().lower())
+    return accepted
+
+
+def choose_encoding(accept_encoding):
+    """brotli if the client takes it and we have it, else gzip, else nothing"""
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def available_encodings():
+    """content encodings we can produce with whats installed"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress_body(body, encoding, best=False):
+    """
+    compress bytes with 'br' or 'gzip'
+
+    best=True uses the slowest/smallest setting, for bodies that get
+    compressed once and cached
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=11 if best else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=9 if best else GZIP_LEVEL)
+
+
+def compress_response(response, accept_encoding):
+    """
+    compress a finished flask response in place if its worth it
+
+    skips streamed responses, errors, and anything already encoded
+    (like the pre-gzipped zone map)
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    encoding = choose_encoding(accept_encoding or '')
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+
+    response.set_data(compress_body(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,101 @@
+# streaming export for /export
+#
+# analysts want the whole filtered result, not 100 rows. we never hold the
+# full result: the cursor is read EXPORT_CHUNK_ROWS at a time and each chunk
+# is turned into bytes and sent straight away, so server memory stays the
+# same for 1 thousand or 10 million rows.
+#   - csv: header once, then each chunk as csv text
+#   - parquet: one row group per chunk, the footer goes out at the end
+
+import csv
+import io
+
+EXPORT_CHUNK_ROWS = 10000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+# sqlite declared type -> arrow type for the parquet schema
+SQLITE_TO_ARROW = {
+    'INTEGER': 'int64',
+    'REAL': 'float64',
+    'TEXT': 'string'
+}
+
+
+def fetch_chunks(cursor, chunk_rows=EXPORT_CHUNK_ROWS):
+    """yield lists of row tuples until the cursor is empty"""
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            return
+        yield rows
+
+
+def csv_stream(columns, chunks):
+    """yield utf-8 csv bytes, header first then one piece per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+    # header only, if there were no rows
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class DrainableBuffer(io.BytesIO):
+    """
+    BytesIO that we can empty after each row group
+
+    tell() keeps counting from the start of the file because the parquet
+    writer uses it for the offsets in the footer
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.drained = 0
+
+    def tell(self):
+        return self.drained + super().tell()
+
+    def drain(self):
+        data = self.getvalue()
+        self.drained += len(data)
+        self.seek(0)
+        self.truncate()
+        return data
+
+
+def parquet_stream(columns, column_types, chunks):
+    """
+    yield parquet file bytes, one row group per chunk
+
+    column_types: sqlite declared types (INTEGER/REAL/TEXT) in column order
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        (col, SQLITE_TO_ARROW.get((col_type or '').upper(), 'string'))
+        for col, col_type in zip(columns, column_types)
+    ])
+
+    sink = DrainableBuffer()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in chunks:
+            data = {col: list(values) for col, values in zip(columns, zip(*rows))}
+            writer.write_table(pa.Table.from_pydict(data, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+
+    yield sink.drain()
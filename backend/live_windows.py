@@ -0,0 +1,153 @@
+# rolling "live" aggregates for replay mode
+#
+# the replay driver (data_processing/replay.py) posts trips in pickup-time
+# order and we keep counts/revenue/fares for the last 15 and 60 minutes per
+# zone and per borough.
+#
+# each zone/borough has a ring buffer of 60 one-minute buckets. adding a trip
+# only touches the bucket for its minute (slot = minute % 60), and if that
+# slot still holds an older minute it gets reset first - so every trip is
+# O(1) no matter how many trips are in the window. reading a window sums at
+# most 60 buckets.
+#
+# "now" is the latest pickup time we've seen (event time), not the wall
+# clock, since replays run faster than real time.
+
+import threading
+
+BUCKET_SECONDS = 60
+RING_SIZE = 60  # minutes of history = the biggest window we can answer
+WINDOW_MINUTES = (15, 60)
+
+
+class RingWindow:
+    """per-minute buckets for one zone or borough"""
+
+    __slots__ = ('minutes', 'counts', 'revenue', 'fares')
+
+    def __init__(self):
+        self.minutes = [-1] * RING_SIZE
+        self.counts = [0] * RING_SIZE
+        self.revenue = [0.0] * RING_SIZE
+        self.fares = [0.0] * RING_SIZE
+
+    def add(self, minute, fare, total):
+        slot = minute % RING_SIZE
+        if self.minutes[slot] != minute:
+            if self.minutes[slot] > minute:
+                return False  # slot already moved on, trip is too old
+            self.minutes[slot] = minute
+            self.counts[slot] = 0
+            self.revenue[slot] = 0.0
+            self.fares[slot] = 0.0
+        self.counts[slot] += 1
+        self.revenue[slot] += total
+        self.fares[slot] += fare
+        return True
+
+    def totals(self, now_minute, window):
+        """(count, revenue, fare_sum) for minutes in (now - window, now]"""
+        oldest = now_minute - window
+        count = 0
+        revenue = 0.0
+        fares = 0.0
+        for slot in range(RING_SIZE):
+            minute = self.minutes[slot]
+            if oldest < minute <= now_minute:
+                count += self.counts[slot]
+                revenue += self.revenue[slot]
+                fares += self.fares[slot]
+        return count, revenue, fares
+
+
+class LiveAggregates:
+    """
+    rolling windows for every zone and borough
+
+    ingest() takes column lists (pickup_time in epoch seconds, pickup_zone_id,
+    fare_amount, total_amount) so a micro-batch doesnt need a dict per trip
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.zones = {}
+            self.boroughs = {}
+            self.latest_minute = None
+            self.trips_ingested = 0
+            self.trips_dropped = 0
+
+    def ingest(self, pickup_times, zone_ids, fares, totals, zone_boroughs):
+        """
+        add a micro-batch of trips
+
+        zone_boroughs: {zone_id: borough} used to roll zones up to boroughs
+
+        returns number of trips added (trips older than the ring are dropped)
+        """
+        added = 0
+        with self._lock:
+            for pickup_time, zone_id, fare, total in zip(pickup_times, zone_ids, fares, totals):
+                minute = int(pickup_time) // BUCKET_SECONDS
+                if self.latest_minute is not None and minute <= self.latest_minute - RING_SIZE:
+                    self.trips_dropped += 1
+                    continue
+
+                fare = fare or 0.0
+                total = total or 0.0
+
+                zone_window = self.zones.get(zone_id)
+                if zone_window is None:
+                    zone_window = self.zones[zone_id] = RingWindow()
+                if not zone_window.add(minute, fare, total):
+                    self.trips_dropped += 1
+                    continue
+
+                borough = zone_boroughs.get(zone_id, 'Unknown')
+                borough_window = self.boroughs.get(borough)
+                if borough_window is None:
+                    borough_window = self.boroughs[borough] = RingWindow()
+                borough_window.add(minute, fare, total)
+
+                if self.latest_minute is None or minute > self.latest_minute:
+                    self.latest_minute = minute
+                added += 1
+
+            self.trips_ingested += added
+        return added
+
+    def snapshot(self, level='borough', window=15):
+        """
+        current window totals for every zone or borough with trips in it
+
+        returns {"as_of": epoch seconds, "window_minutes":.., "level":.., "rows": [...]}
+        """
+        key_name = 'borough' if level == 'borough' else 'zone_id'
+
+        with self._lock:
+            windows = self.boroughs if level == 'borough' else self.zones
+            now = self.latest_minute
+            rows = []
+            if now is not None:
+                for key, ring in windows.items():
+                    count, revenue, fares = ring.totals(now, window)
+                    if count == 0:
+                        continue
+                    rows.append({
+                        key_name: key,
+                        "trip_count": count,
+                        "revenue": round(revenue, 2),
+                        "average_fare": round(fares / count, 2)
+                    })
+
+            return {
+                "as_of": now * BUCKET_SECONDS if now is not None else None,
+                "window_minutes": window,
+                "level": level,
+                "trips_ingested": self.trips_ingested,
+                "trips_dropped": self.trips_dropped,
+                "rows": rows
+            }
@@ -0,0 +1,174 @@
+# parallel aggregate scans
+#
+# sqlite runs one query on one core. for aggregates that no index covers
+# (like AVG(fare_amount) over a filter) we split the trips table into
+# trip_id ranges, run the same query on each range at the same time on
+# separate read-only connections, then merge the partial results.
+#
+# this works with threads because python's sqlite3 module releases the GIL
+# while sqlite is running the query. count/sum/min/max merge exactly, and
+# avg is just sum/count after merging.
+#
+# set TAXI_SCAN_WORKERS to change how many shards run at once
+# (default = number of cpu cores)
+
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = int(os.environ.get('TAXI_SCAN_WORKERS', os.cpu_count() or 1))
+
+# tables smaller than this get scanned in one go, splitting costs more than it saves
+MIN_ROWS_PER_SHARD = 50000
+
+
+class PartialAggregate:
+    """count/sum/min/max of one column - can be merged with other partials"""
+
+    def __init__(self, count=0, total=0.0, minimum=None, maximum=None):
+        self.count = count
+        self.sum = total
+        self.min = minimum
+        self.max = maximum
+
+    def merge(self, count, total, minimum, maximum):
+        # count = number of non-null values (like COUNT(col) in sql)
+        if not count:
+            return
+        self.count += count
+        self.sum += total or 0
+        if self.min is None or (minimum is not None and minimum < self.min):
+            self.min = minimum
+        if self.max is None or (maximum is not None and maximum > self.max):
+            self.max = maximum
+
+    @property
+    def avg(self):
+        return self.sum / self.count if self.count else None
+
+
+class ParallelScanner:
+    """
+    runs aggregate queries on trips split into trip_id ranges
+
+    usage:
+        scanner = ParallelScanner(db_path)
+        result = scanner.aggregate(['fare_amount'], where="z.borough = ?",
+                                   params=['Manhattan'], group_by=['t.pickup_hour'],
+                                   join_zones=True)
+        result[(8,)]['rows']               -> trips in hour 8
+        result[(8,)]['fare_amount'].avg    -> average fare in hour 8
+    """
+
+    def __init__(self, db_path, workers=DEFAULT_WORKERS):
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _get_executor(self):
+        # made on first use so importing the app doesnt start threads
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scan')
+            return self._executor
+
+    def _connection(self):
+        # one read-only connection per worker thread, reused between queries.
+        # keyed on the file's (device, inode): if the loader deletes and
+        # recreates the database, an old connection would keep reading the
+        # deleted file, so reopen when the inode changes
+        try:
+            stat = os.stat(self.db_path)
+        except FileNotFoundError:
+            raise FileNotFoundError("database not found - run the loader script first")
+        file_id = (stat.st_dev, stat.st_ino)
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.file_id != file_id:
+            conn.close()
+            conn = None
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+            self._local.file_id = file_id
+        return conn
+
+    def shard_ranges(self):
+        """
+        split [min trip_id, max trip_id] into one range per worker
+
+        returns list of (low, high) inclusive ranges, empty if no trips
+        """
+        low, high = self._connection().execute("SELECT MIN(trip_id), MAX(trip_id) FROM trips").fetchone()
+        if low is None:
+            return []
+
+        span = high - low + 1
+        shards = min(self.workers, max(1, span // MIN_ROWS_PER_SHARD))
+        step = -(-span // shards)  # ceiling division
+
+        ranges = []
+        for start in range(low, high + 1, step):
+            ranges.append((start, min(start + step - 1, high)))
+        return ranges
+
+    def _scan_shard(self, sql, params):
+        return self._connection().execute(sql, params).fetchall()
+
+    def aggregate(self, columns, where='', params=(), group_by=None, join_zones=False):
+        """
+        aggregate columns over trips (alias t), optionally filtered and grouped
+
+        columns: column expressions to aggregate, e.g. ['fare_amount', 't.tip_amount']
+        where: extra sql condition (use ? placeholders), ANDed with the shard range
+        params: values for the placeholders in where
+        group_by: list of sql expressions to group on (None = one group)
+        join_zones: LEFT JOIN zones z on the pickup zone (for borough filters)
+
+        returns {group_key_tuple: {"rows": int, column: PartialAggregate, ...}}
+        """
+        group_by = list(group_by or [])
+
+        select_parts = list(group_by) + ['COUNT(*)']
+        for col in columns:
+            select_parts += [f'COUNT({col})', f'SUM({col})', f'MIN({col})', f'MAX({col})']
+
+        sql = f"SELECT {', '.join(select_parts)} FROM trips t"
+        if join_zones:
+            sql += " LEFT JOIN zones z ON t.pickup_zone_id = z.zone_id"
+        sql += " WHERE t.trip_id BETWEEN ? AND ?"
+        if where:
+            sql += f" AND ({where})"
+        if group_by:
+            sql += f" GROUP BY {', '.join(group_by)}"
+
+        ranges = self.shard_ranges()
+        if len(ranges) <= 1:
+            # small table - not worth handing off to the pool
+            partials = [self._scan_shard(sql, list(r) + list(params)) for r in ranges]
+        else:
+            executor = self._get_executor()
+            futures = [executor.submit(self._scan_shard, sql, list(r) + list(params)) for r in ranges]
+            partials = [f.result() for f in futures]
+
+        n_groups = len(group_by)
+        results = {}
+        for rows in partials:
+            for row in rows:
+                key = tuple(row[:n_groups])
+                if key not in results:
+                    results[key] = {"rows": 0}
+                    for col in columns:
+                        results[key][col] = PartialAggregate()
+
+                group = results[key]
+                group["rows"] += row[n_groups]
+                pos = n_groups + 1
+                for col in columns:
+                    group[col].merge(*row[pos:pos + 4])
+                    pos += 4
+
+        return results
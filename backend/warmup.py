@@ -0,0 +1,166 @@
+# startup warm-up for the backend
+#
+# after a restart the first dashboard load used to pay for every cold query
+# (full scans for /summary, /average-fare-by-hour and /top-zones) and we only
+# found out the database was missing when a request failed. this runs on a
+# background thread when the app starts:
+#   1. open the database and check the tables/columns we query exist
+#   2. read the db file once so its pages are in the os cache
+#   3. run the "precompute" jobs (app.py passes in the default dashboard
+#      responses) so they are cached before real traffic arrives
+# /health/ready only says ok once this finished, so a load balancer can wait
+# for it. /health/live just says the process is up.
+
+import os
+import sqlite3
+import threading
+import time
+
+# columns the api actually uses - if any are missing the loader wasnt run
+# with the current schema.sql
+REQUIRED_COLUMNS = {
+    'zones': ['zone_id', 'zone_name', 'borough'],
+    'trips': ['trip_id', 'pickup_datetime', 'dropoff_datetime', 'pickup_zone_id',
+              'dropoff_zone_id', 'trip_distance', 'fare_amount', 'tip_amount',
+              'total_amount', 'pickup_hour']
+}
+
+# how long to wait before trying again if the database isnt there yet
+RETRY_SECONDS = 5
+# read the db file in 1MB chunks when pre-touching pages
+PAGE_TOUCH_CHUNK = 1024 * 1024
+
+
+class WarmupState:
+    """
+    shared status that the health endpoints read
+
+    status goes: starting -> warming -> ready
+    or ends up as "error" (with a message) and keeps retrying
+
+    optional jobs that fail end up in warnings instead - they dont stop
+    the api from being ready
+    """
+
+    def __init__(self):
+        self.status = 'starting'
+        self.error = None
+        self.started_at = time.time()
+        self.ready_at = None
+        self.steps = {}
+        self.warnings = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def is_ready(self):
+        return self.status == 'ready'
+
+    def set(self, status, error=None):
+        with self._lock:
+            self.status = status
+            self.error = error
+            if status == 'ready':
+                self.ready_at = time.time()
+
+    def record_step(self, name, seconds):
+        with self._lock:
+            self.steps[name] = round(seconds, 3)
+
+    def record_warning(self, name, message):
+        with self._lock:
+            self.warnings[name] = message
+
+    def to_dict(self):
+        with self._lock:
+            result = {"status": self.status, "steps": dict(self.steps)}
+            if self.error:
+                result["error"] = self.error
+            if self.warnings:
+                result["warnings"] = dict(self.warnings)
+            if self.ready_at:
+                result["warmup_seconds"] = round(self.ready_at - self.started_at, 3)
+            return result
+
+
+def validate_schema(db_path):
+    """
+    check the database has every table/column the api needs
+
+    raises FileNotFoundError if the db is missing, RuntimeError if the schema is wrong
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError("database not found - run the loader script first")
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        for table, columns in REQUIRED_COLUMNS.items():
+            found = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+            if not found:
+                raise RuntimeError(f"table '{table}' is missing - run the loader script")
+            missing = [col for col in columns if col not in found]
+            if missing:
+                raise RuntimeError(f"table '{table}' is missing columns: {', '.join(missing)}")
+    finally:
+        conn.close()
+
+
+def touch_pages(db_path):
+    """read the whole db file once so sqlite finds its pages in the os cache"""
+    with open(db_path, 'rb') as f:
+        while f.read(PAGE_TOUCH_CHUNK):
+            pass
+
+
+def run_warmup(state, db_path, precompute_jobs, optional_jobs=()):
+    """
+    do the warm-up steps, retrying while the database is missing/broken
+
+    precompute_jobs: list of (name, function) - each function fills a cache
+    optional_jobs: names of jobs whose errors are only recorded as warnings
+    (e.g. the zone map, which needs extra files) - only database/schema
+    problems keep the api un-ready
+    """
+    while True:
+        try:
+            state.set('warming')
+
+            started = time.time()
+            validate_schema(db_path)
+            state.record_step('validate_schema', time.time() - started)
+
+            started = time.time()
+            touch_pages(db_path)
+            state.record_step('touch_pages', time.time() - started)
+
+            for name, job in precompute_jobs:
+                started = time.time()
+                try:
+                    job()
+                except Exception as e:
+                    if name not in optional_jobs:
+                        raise
+                    state.record_warning(name, f"{type(e).__name__}: {e}")
+                    continue
+                state.record_step(name, time.time() - started)
+
+            state.set('ready')
+            return
+
+        except Exception as e:
+            state.set('error', str(e))
+            time.sleep(RETRY_SECONDS)
+
+
+def start_warmup(state, db_path, precompute_jobs, optional_jobs=()):
+    """start run_warmup on a daemon thread (only once per state)"""
+    with state._lock:
+        if state._thread is not None:
+            return state._thread
+        state._thread = threading.Thread(
+            target=run_warmup,
+            args=(state, db_path, precompute_jobs, optional_jobs),
+            name='warmup',
+            daemon=True
+        )
+    state._thread.start()
+    return state._thread
@@ -0,0 +1,211 @@
+# zone map geometry for the choropleth
+#
+# the raw taxi_zones.geojson is big (lots of tiny coordinate steps along the
+# coastline) so we simplify it ONCE with douglas-peucker, round the coordinates
+# and save the result in data/processed. the /zones/map endpoint only has to
+# join per-zone stats onto the small cached version.
+#
+# build it ahead of time with:
+#   python backend/zone_map.py --tolerance 0.0001 --precision 5
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+# same geojson property handling as the cleaner's zone index
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'data_processing'))
+from zone_geojson import get_zone_id
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+RAW_GEOJSON_PATH = os.path.join(DATA_DIR, 'raw', 'taxi_zones.geojson')
+SIMPLIFIED_GEOJSON_PATH = os.path.join(DATA_DIR, 'processed', 'taxi_zones_simplified.json')
+
+# tolerance is in degrees (0.0001 deg is roughly 10m in nyc)
+DEFAULT_TOLERANCE = 0.0001
+# decimal places kept after simplifying (5 places is roughly 1m)
+DEFAULT_PRECISION = 5
+
+
+def simplify_ring(points, tolerance):
+    """
+    douglas-peucker on one ring of [lng, lat] points
+
+    keeps the point furthest from the line between the two ends if its further
+    than tolerance, then does the same on both halves. done with a stack
+    instead of recursion since some rings have thousands of points
+
+    time: O(p log p) on average, O(p^2) worst case
+    """
+    pts = np.asarray(points, dtype=float)
+    if tolerance <= 0 or len(pts) <= 4:
+        return pts
+
+    keep = np.zeros(len(pts), dtype=bool)
+    keep[0] = True
+    keep[-1] = True
+    stack = [(0, len(pts) - 1)]
+
+    while stack:
+        start, end = stack.pop()
+        if end <= start + 1:
+            continue
+
+        inner = pts[start + 1:end]
+        a = pts[start]
+        b = pts[end]
+        dx, dy = b - a
+        length = np.hypot(dx, dy)
+
+        if length == 0:
+            # closed ring - start and end are the same point
+            dist = np.hypot(inner[:, 0] - a[0], inner[:, 1] - a[1])
+        else:
+            dist = np.abs(dx * (inner[:, 1] - a[1]) - dy * (inner[:, 0] - a[0])) / length
+
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return pts[keep]
+
+
+def quantize_ring(points, precision):
+    """round coords and drop points that became duplicates of the one before"""
+    pts = np.round(np.asarray(points, dtype=float), precision)
+    if len(pts) < 2:
+        return pts
+    changed = np.any(pts[1:] != pts[:-1], axis=1)
+    return np.vstack([pts[:1], pts[1:][changed]])
+
+
+def simplify_polygon(rings, tolerance, precision):
+    """simplify outer ring + holes, dropping holes that collapse"""
+    out = []
+    for idx, ring in enumerate(rings):
+        simple = quantize_ring(simplify_ring(ring, tolerance), precision)
+        if len(simple) < 4:
+            if idx > 0:
+                continue  # hole got too small to matter
+            # tiny zone - keep the original shape (just rounded)
+            simple = quantize_ring(ring, precision)
+        out.append(simple.tolist())
+    return out
+
+
+def build_simplified_geometry(src=RAW_GEOJSON_PATH, dest=SIMPLIFIED_GEOJSON_PATH,
+                              tolerance=DEFAULT_TOLERANCE, precision=DEFAULT_PRECISION):
+    """
+    read the raw geojson, simplify every zone and save the result
+
+    returns the cached dict:
+        {"tolerance": .., "precision": .., "source_mtime": .., "features": [...]}
+    where each feature only keeps the zone id as a property
+    """
+    with open(src, 'r') as f:
+        raw = json.load(f)
+
+    features = []
+    for feature in raw.get('features', []):
+        zone_id = get_zone_id(feature.get('properties') or {})
+        geometry = feature.get('geometry')
+        if zone_id is None or not geometry:
+            continue
+
+        if geometry['type'] == 'Polygon':
+            coords = simplify_polygon(geometry['coordinates'], tolerance, precision)
+        elif geometry['type'] == 'MultiPolygon':
+            coords = [simplify_polygon(poly, tolerance, precision) for poly in geometry['coordinates']]
+        else:
+            continue
+
+        features.append({
+            "type": "Feature",
+            "id": zone_id,
+            "geometry": {"type": geometry['type'], "coordinates": coords}
+        })
+
+    cached = {
+        "tolerance": tolerance,
+        "precision": precision,
+        "source_mtime": os.path.getmtime(src),
+        "features": features
+    }
+
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp_path = dest + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cached, f, separators=(',', ':'))
+    os.replace(tmp_path, dest)
+
+    return cached
+
+
+def load_simplified_geometry(src=RAW_GEOJSON_PATH, dest=SIMPLIFIED_GEOJSON_PATH):
+    """
+    load the cached simplified geometry, building it with the default settings
+    if it doesnt exist yet or the raw geojson changed since it was built
+    """
+    if not os.path.exists(src) and not os.path.exists(dest):
+        raise FileNotFoundError("taxi_zones.geojson not found - put it in data/raw")
+
+    if os.path.exists(dest):
+        with open(dest, 'r') as f:
+            cached = json.load(f)
+        if not os.path.exists(src) or cached.get('source_mtime') == os.path.getmtime(src):
+            return cached
+        # raw file changed, rebuild with whatever settings were used last time
+        return build_simplified_geometry(src, dest, cached['tolerance'], cached['precision'])
+
+    return build_simplified_geometry(src, dest)
+
+
+def build_zone_map_payload(geometry, zone_stats):
+    """
+    join per-zone stats onto the simplified geometry
+
+    geometry: dict from load_simplified_geometry
+    zone_stats: {zone_id: {"zone_name":.., "borough":.., "trip_count":.., ...}}
+
+    returns a geojson FeatureCollection, zones with no trips get trip_count 0
+    """
+    features = []
+    for feature in geometry['features']:
+        zone_id = feature['id']
+        stats = zone_stats.get(zone_id, {})
+        features.append({
+            "type": "Feature",
+            "id": zone_id,
+            "properties": {
+                "zone_id": zone_id,
+                "zone_name": stats.get("zone_name"),
+                "borough": stats.get("borough"),
+                "trip_count": stats.get("trip_count", 0),
+                "average_fare": stats.get("average_fare"),
+                "average_tip": stats.get("average_tip")
+            },
+            "geometry": feature['geometry']
+        })
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="simplify taxi_zones.geojson for the zone map")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="douglas-peucker tolerance in degrees")
+    parser.add_argument('--precision', type=int, default=DEFAULT_PRECISION,
+                        help="decimal places to keep")
+    args = parser.parse_args()
+
+    raw_size = os.path.getsize(RAW_GEOJSON_PATH)
+    result = build_simplified_geometry(tolerance=args.tolerance, precision=args.precision)
+    new_size = os.path.getsize(SIMPLIFIED_GEOJSON_PATH)
+
+    print(f"simplified {len(result['features'])} zones")
+    print(f"{raw_size:,} bytes -> {new_size:,} bytes ({new_size / raw_size * 100:.1f}%)")
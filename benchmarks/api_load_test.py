@@ -0,0 +1,449 @@
+# =============================================================================
+# API Load Test + Latency Regression Check
+# =============================================================================
+# Measures how backend/app.py holds up under concurrent dashboard traffic:
+#
+# 1. builds a fixture database with N random trips (same schema.sql)
+# 2. starts the api on a local port pointed at that database and waits for
+#    /health/ready
+# 3. replays a fixed mix of dashboard requests (/summary, /trips with
+#    borough/hour filters, /average-fare-by-hour, /top-zones?n=) at each
+#    concurrency level
+# 4. does it all twice:
+#    - "cached": the normal app. after warm-up /summary,
+#      /average-fare-by-hour and /top-zones come from the in-memory response
+#      cache, so these numbers are cache hits (dict -> json)
+#    - "uncached": the app started with TAXI_DISABLE_RESPONSE_CACHE=1, so
+#      every request runs its query (parallel scanner, top zones sort...)
+# 5. prints throughput and p50/p95/p99 per endpoint, compares them with
+#    benchmarks/baselines.json and exits with code 1 if throughput, p50 or
+#    p95 got worse than the threshold allows
+#
+# Usage:
+#   python benchmarks/api_load_test.py                      # check vs baseline
+#   python benchmarks/api_load_test.py --update-baseline    # save new baseline
+#   python benchmarks/api_load_test.py --trips 500000 --concurrency 1,8,32
+#
+# Baselines depend on the machine, so re-run with --update-baseline when you
+# switch computers and commit the new file.
+# =============================================================================
+
+import argparse
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SCHEMA_PATH = os.path.join(ROOT_DIR, 'database', 'schema.sql')
+BACKEND_DIR = os.path.join(ROOT_DIR, 'backend')
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+BOROUGHS = ['Manhattan', 'Brooklyn', 'Queens', 'Bronx', 'Staten Island', 'EWR']
+NUM_ZONES = 265
+
+# share of requests per endpoint - roughly what a dashboard session sends
+# (page load hits everything once, then people mostly play with the filters)
+REQUEST_MIX = [
+    ('summary', 15),
+    ('trips', 45),
+    ('average_fare_by_hour', 15),
+    ('top_zones', 25)
+]
+
+DEFAULT_TRIPS = 100000
+DEFAULT_CONCURRENCY = [1, 4, 16]
+DEFAULT_REQUESTS = 400          # per concurrency level
+DEFAULT_UNCACHED_REQUESTS = 200 # per concurrency level - each one is a real query
+DEFAULT_THRESHOLD = 0.25        # 25% slower than baseline = regression
+# ...and at least this many ms slower, so 1ms -> 1.3ms noise doesnt fail the run
+DEFAULT_MIN_DELTA_MS = 2.0
+# p95 of fewer requests than this is basically the max, so only p50 is checked
+MIN_SAMPLES_FOR_P95 = 40
+# each level runs this many times and the fastest run counts - noise from
+# other processes only ever makes a run slower
+DEFAULT_REPEAT = 3
+SEED = 42
+
+PHASES = {
+    'cached': "warm response cache - /summary, /average-fare-by-hour and /top-zones are cache hits",
+    'uncached': "TAXI_DISABLE_RESPONSE_CACHE=1 - every request runs its query"
+}
+
+
+# ---------------------------------------------------------------------------
+# fixture database
+# ---------------------------------------------------------------------------
+
+def build_fixture_db(path, num_trips, seed=SEED):
+    """Create a database with schema.sql, all zones and num_trips random trips."""
+    rng = random.Random(seed)
+
+    conn = sqlite3.connect(path)
+    with open(SCHEMA_PATH, 'r') as f:
+        conn.executescript(f.read())
+
+    conn.executemany(
+        "INSERT INTO zones (zone_id, zone_name, borough, service_zone) VALUES (?, ?, ?, ?)",
+        [(z, f'Zone {z}', BOROUGHS[z % len(BOROUGHS)], 'Yellow Zone') for z in range(1, NUM_ZONES + 1)]
+    )
+
+    # a few busy zones like the real data (midtown, airports...)
+    busy_zones = rng.sample(range(1, NUM_ZONES + 1), 20)
+
+    def make_trip():
+        pickup = 1704067200 + rng.randrange(31 * 86400)  # january 2024
+        duration = rng.uniform(2, 60)
+        distance = round(rng.uniform(0.3, 20), 2)
+        fare = round(3 + distance * 2.5 + rng.uniform(0, 5), 2)
+        tip = round(fare * rng.choice([0, 0.1, 0.15, 0.2]), 2)
+        zone = rng.choice(busy_zones) if rng.random() < 0.6 else rng.randint(1, NUM_ZONES)
+        hour = time.gmtime(pickup).tm_hour
+        return (
+            time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(pickup)),
+            time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(pickup + duration * 60)),
+            zone, rng.randint(1, NUM_ZONES),
+            distance, rng.randint(1, 4),
+            fare, tip, 0.0, round(fare + tip + 2.5, 2),
+            rng.randint(1, 4),
+            round(duration, 2), round(fare / distance, 2), hour
+        )
+
+    batch_size = 10000
+    for start in range(0, num_trips, batch_size):
+        conn.executemany("""
+            INSERT INTO trips (
+                pickup_datetime, dropoff_datetime,
+                pickup_zone_id, dropoff_zone_id,
+                trip_distance, passenger_count,
+                fare_amount, tip_amount, tolls_amount, total_amount,
+                payment_type,
+                trip_duration_minutes, fare_per_mile, pickup_hour
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [make_trip() for _ in range(min(batch_size, num_trips - start))])
+
+    conn.commit()
+    conn.close()
+
+
+# ---------------------------------------------------------------------------
+# api server
+# ---------------------------------------------------------------------------
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_api(db_path, port, cache=True, timeout=120):
+    """Start the flask app (threaded, no debug reloader) and wait until ready."""
+    env = dict(os.environ, TAXI_DATABASE_PATH=db_path)
+    if not cache:
+        env['TAXI_DISABLE_RESPONSE_CACHE'] = '1'
+    code = (
+        "import sys; sys.path.insert(0, sys.argv[1]); "
+        "from app import app; app.run(host='127.0.0.1', port=int(sys.argv[2]), threaded=True)"
+    )
+    proc = subprocess.Popen(
+        [sys.executable, '-c', code, BACKEND_DIR, str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    url = f'http://127.0.0.1:{port}/health/ready'
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("api process exited during startup")
+        try:
+            with urllib.request.urlopen(url) as res:
+                if res.status == 200:
+                    return proc
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.2)
+
+    proc.terminate()
+    raise RuntimeError(f"api was not ready after {timeout}s")
+
+
+# ---------------------------------------------------------------------------
+# load generation
+# ---------------------------------------------------------------------------
+
+def build_request_plan(num_requests, seed=SEED):
+    """Same list of (endpoint, path) every run so results are comparable."""
+    rng = random.Random(seed)
+    names = [name for name, _ in REQUEST_MIX]
+    weights = [weight for _, weight in REQUEST_MIX]
+
+    plan = []
+    for _ in range(num_requests):
+        name = rng.choices(names, weights)[0]
+        if name == 'summary':
+            path = '/summary'
+        elif name == 'average_fare_by_hour':
+            path = '/average-fare-by-hour'
+        elif name == 'top_zones':
+            path = f'/top-zones?n={rng.choice([5, 10, 20])}'
+        else:
+            params = []
+            if rng.random() < 0.7:
+                params.append(f'borough={rng.choice(BOROUGHS).replace(" ", "%20")}')
+            if rng.random() < 0.6:
+                params.append(f'hour={rng.randrange(24)}')
+            path = '/trips' + ('?' + '&'.join(params) if params else '')
+        plan.append((name, path))
+    return plan
+
+
+def run_level(base_url, plan, concurrency):
+    """
+    Send every request in plan using `concurrency` threads.
+
+    Returns:
+        (elapsed seconds, list of (endpoint, latency_ms, ok))
+    """
+    results = []
+    results_lock = threading.Lock()
+    next_index = [0]
+
+    def worker():
+        while True:
+            with results_lock:
+                i = next_index[0]
+                next_index[0] += 1
+            if i >= len(plan):
+                return
+
+            name, path = plan[i]
+            started = time.perf_counter()
+            try:
+                req = urllib.request.Request(base_url + path, headers={'Accept-Encoding': 'gzip'})
+                with urllib.request.urlopen(req) as res:
+                    res.read()
+                    ok = res.status == 200
+            except (urllib.error.URLError, ConnectionError):
+                ok = False
+            latency = (time.perf_counter() - started) * 1000
+
+            with results_lock:
+                results.append((name, latency, ok))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - started, results
+
+
+def percentile(sorted_values, pct):
+    """nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(elapsed, results):
+    """throughput + latency percentiles overall and per endpoint"""
+    summary = {
+        "requests": len(results),
+        "errors": sum(1 for _, _, ok in results if not ok),
+        "throughput_rps": round(len(results) / elapsed, 1) if elapsed > 0 else 0.0,
+        "endpoints": {}
+    }
+    for name, _ in REQUEST_MIX:
+        latencies = sorted(latency for n, latency, _ in results if n == name)
+        if not latencies:
+            continue
+        summary["endpoints"][name] = {
+            "count": len(latencies),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2)
+        }
+    return summary
+
+
+# ---------------------------------------------------------------------------
+# baseline comparison
+# ---------------------------------------------------------------------------
+
+def compare_with_baseline(report, baseline, threshold, min_delta_ms=DEFAULT_MIN_DELTA_MS):
+    """
+    List every regression beyond threshold.
+
+    Checked per phase and concurrency level: throughput must not drop by
+    more than threshold, and p50/p95 per endpoint must not grow by more than
+    threshold (and by more than min_delta_ms). p95 is only checked for
+    endpoints with at least MIN_SAMPLES_FOR_P95 requests, and p99 is only
+    reported - with few samples they are basically the slowest request and
+    too noisy to fail a run on.
+    """
+    regressions = []
+    for phase, phase_report in report["phases"].items():
+        base_phase = baseline.get("phases", {}).get(phase)
+        if base_phase is None:
+            continue
+
+        for level, current in phase_report["levels"].items():
+            base = base_phase["levels"].get(level)
+            if base is None:
+                continue
+            label = f"{phase} c={level}"
+
+            if current["errors"] > base.get("errors", 0):
+                regressions.append(f"{label}: {current['errors']} errors (baseline {base.get('errors', 0)})")
+
+            if current["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+                regressions.append(
+                    f"{label}: throughput {current['throughput_rps']} rps < baseline {base['throughput_rps']} rps"
+                )
+
+            for name, stats in current["endpoints"].items():
+                base_stats = base["endpoints"].get(name)
+                if base_stats is None:
+                    continue
+                keys = ['p50_ms']
+                if min(stats["count"], base_stats["count"]) >= MIN_SAMPLES_FOR_P95:
+                    keys.append('p95_ms')
+                for key in keys:
+                    limit = max(base_stats[key] * (1 + threshold), base_stats[key] + min_delta_ms)
+                    if stats[key] > limit:
+                        regressions.append(
+                            f"{label} {name}: {key} {stats[key]} > baseline {base_stats[key]}"
+                        )
+    return regressions
+
+
+def print_report(report):
+    print(f"\n--- Results ({report['trips']:,} trips) ---")
+    for phase, phase_report in report["phases"].items():
+        print(f"\n=== {phase}: {PHASES[phase]} ({phase_report['requests_per_level']} requests per level) ===")
+        for level, stats in phase_report["levels"].items():
+            print(f"\nconcurrency {level}: {stats['throughput_rps']} req/s, {stats['errors']} errors")
+            print(f"  {'endpoint':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+            for name, e in stats["endpoints"].items():
+                print(f"  {name:<22}{e['count']:>7}{e['p50_ms']:>10}{e['p95_ms']:>10}{e['p99_ms']:>10}")
+
+
+def run_phase(url, concurrency_levels, num_requests, repeat=DEFAULT_REPEAT):
+    """Run the request plan at every concurrency level against one api (best of `repeat` runs)."""
+    plan = build_request_plan(num_requests)
+
+    # one untimed pass so every /trips filter combo has been seen once
+    run_level(url, plan[:50], 4)
+
+    result = {"requests_per_level": num_requests, "levels": {}}
+    for level in concurrency_levels:
+        print(f"  {num_requests} requests at concurrency {level} (best of {repeat})...")
+        runs = [summarize(*run_level(url, plan, level)) for _ in range(repeat)]
+        result["levels"][str(level)] = max(runs, key=lambda run: run["throughput_rps"])
+    return result
+
+
+def run_load_test(num_trips, concurrency_levels, num_requests, num_uncached_requests, url=None,
+                  repeat=DEFAULT_REPEAT):
+    """
+    Build fixture + start api for each phase (unless url given), run every
+    level, return the report.
+
+    With url only the cached phase runs - we cant restart someone elses
+    server without its cache.
+    """
+    report = {"trips": num_trips, "phases": {}}
+
+    if url is not None:
+        print(f"Running cached phase against {url}...")
+        report["phases"]["cached"] = run_phase(url, concurrency_levels, num_requests, repeat)
+        return report
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'fixture.db')
+
+        print(f"Building fixture database with {num_trips:,} trips...")
+        started = time.time()
+        build_fixture_db(db_path, num_trips)
+        print(f"  done in {time.time() - started:.1f}s")
+
+        phases = [('cached', True, num_requests), ('uncached', False, num_uncached_requests)]
+        for phase, cache, requests_per_level in phases:
+            if requests_per_level <= 0:
+                continue
+
+            port = free_port()
+            print(f"Starting api ({phase}) on port {port} and waiting for /health/ready...")
+            proc = start_api(db_path, port, cache=cache)
+            try:
+                report["phases"][phase] = run_phase(f'http://127.0.0.1:{port}', concurrency_levels,
+                                                    requests_per_level, repeat)
+            finally:
+                proc.terminate()
+                proc.wait(timeout=10)
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test the taxi api and check for latency regressions")
+    parser.add_argument('--trips', type=int, default=DEFAULT_TRIPS, help="trips in the fixture database")
+    parser.add_argument('--concurrency', default=','.join(str(c) for c in DEFAULT_CONCURRENCY),
+                        help="comma separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help="requests per concurrency level")
+    parser.add_argument('--uncached-requests', type=int, default=DEFAULT_UNCACHED_REQUESTS,
+                        help="requests per concurrency level with the response cache off (0 = skip)")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help="runs per level, the fastest one is reported")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument('--min-delta-ms', type=float, default=DEFAULT_MIN_DELTA_MS,
+                        help="latency increases smaller than this never count as regressions")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="baseline json file")
+    parser.add_argument('--update-baseline', action='store_true', help="save these results as the new baseline")
+    parser.add_argument('--url', help="test an already running api instead of starting one")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(',') if c.strip()]
+    report = run_load_test(args.trips, levels, args.requests, args.uncached_requests, args.url, args.repeat)
+    print_report(report)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f"\nSaved baseline to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline} - run with --update-baseline to create one")
+        sys.exit(0)
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+
+    same_requests = all(
+        baseline.get("phases", {}).get(phase, {}).get("requests_per_level") == phase_report["requests_per_level"]
+        for phase, phase_report in report["phases"].items()
+    )
+    if baseline.get("trips") != report["trips"] or not same_requests:
+        print("\nWARNING: baseline was recorded with different --trips/--requests, comparison may not be fair")
+
+    regressions = compare_with_baseline(report, baseline, args.threshold, args.min_delta_ms)
+    if regressions:
+        print(f"\nFAILED - {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+
+    print(f"\nOK - no regressions beyond {args.threshold:.0%} of baseline")
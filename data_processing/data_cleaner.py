@@ -5,15 +5,54 @@
 
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import os
+import sys
+import time
 from datetime import datetime
 
+# so we can import the dedup and zone indexes from this folder
+sys.path.insert(0, os.path.dirname(__file__))
+from dedup_index import DedupIndex, DUPLICATE_KEY_COLUMNS, compute_trip_hashes, has_key_columns
+from zone_index import assign_zone_ids, load_zone_grid_index
+
 # Paths to data files
 DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
 RAW_DATA_DIR = os.path.join(DATA_DIR, 'raw')
 PROCESSED_DATA_DIR = os.path.join(DATA_DIR, 'processed')
 LOG_FILE = os.path.join(DATA_DIR, 'cleaning_log.txt')
 
+# Only these columns are used by the rest of the pipeline and the loader,
+# so we dont read the others (VendorID, extra, mta_tax, ...) at all
+PIPELINE_COLUMNS = [
+    'tpep_pickup_datetime',
+    'tpep_dropoff_datetime',
+    'PULocationID',
+    'DOLocationID',
+    'passenger_count',
+    'trip_distance',
+    'fare_amount',
+    'tip_amount',
+    'tolls_amount',
+    'total_amount',
+    'payment_type',
+    # older files (pre-2016) have coordinates instead of location IDs
+    'pickup_longitude',
+    'pickup_latitude',
+    'dropoff_longitude',
+    'dropoff_latitude'
+]
+
+# With clustered_sample, read random row groups until we have this many times
+# sample_size rows, then reservoir sample from those
+SAMPLE_OVERSAMPLE = 4
+SAMPLE_SEED = 42
+
+# Zone shapes for turning coordinates into zone IDs (see zone_index.py)
+ZONE_GEOJSON_FILE = os.path.join(RAW_DATA_DIR, 'taxi_zones.geojson')
+
 def log_message(message):
     """Write a message to the cleaning log file."""
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -22,29 +61,211 @@ def log_message(message):
     print(message)
 
 
-def load_trip_data(filepath):
+def load_trip_data(filepath, columns=PIPELINE_COLUMNS, date_filter=None, sample_size=None,
+                   clustered_sample=False):
     """
     Load the yellow taxi trip data from parquet or CSV file.
     
+    For parquet files the filters are pushed down into the reader so we only
+    pay for the data we keep:
+    - columns: only these columns are read (None = all)
+    - date_filter: row groups whose pickup times all start at/after the date
+      are skipped using the file statistics, the rest are filtered per batch
+    - sample_size: every (column-projected) batch that passes date_filter
+      goes through a reservoir sample (fixed seed), so the sample is
+      uniform over the whole file without holding it all in memory
+    
     Args:
         filepath: Path to the data file (.parquet or .csv)
+        columns: Columns to read (missing ones are ignored)
+        date_filter: Only keep trips picked up before this date (e.g. '2019-01-08')
+        sample_size: Number of rows to sample. None = keep all.
+        clustered_sample: Parquet only - read just enough random row groups
+            for the sample (faster, but a few chunks of the month, not uniform)
         
     Returns:
         pandas DataFrame with trip data
     """
     if filepath.endswith('.parquet'):
-        df = pd.read_parquet(filepath)
+        df = read_parquet_pushdown(filepath, columns, date_filter, sample_size, clustered_sample)
     elif filepath.endswith('.csv'):
         # Parse dates for CSV files
         date_cols = ['tpep_pickup_datetime', 'tpep_dropoff_datetime']
-        df = pd.read_csv(filepath, parse_dates=date_cols)
+        usecols = (lambda col: col in columns) if columns else None
+        df = pd.read_csv(filepath, parse_dates=date_cols, usecols=usecols)
+        
+        # CSV has no statistics to skip with, so filter/sample after reading
+        if date_filter:
+            df = df[df['tpep_pickup_datetime'] < pd.Timestamp(date_filter)]
+        if sample_size and len(df) > sample_size:
+            df = df.sample(n=sample_size, random_state=SAMPLE_SEED)
     else:
         raise ValueError(f"Unsupported file format: {filepath}. Use .parquet or .csv")
     
     log_message(f"Loaded {len(df):,} records from: {filepath}")
+    if date_filter:
+        log_message(f"Filtered to trips before {date_filter}")
+    if sample_size:
+        log_message(f"Sampled up to {sample_size:,} rows from dataset")
     return df
 
 
+def select_row_groups(parquet_file, date_filter):
+    """
+    Pick the row groups that can contain trips before date_filter.
+    
+    Uses the min pickup time stored in each row group's statistics, so
+    skipped row groups are never read from disk.
+    
+    Returns:
+        list of row group indexes
+    """
+    metadata = parquet_file.metadata
+    all_groups = list(range(metadata.num_row_groups))
+    
+    if not date_filter:
+        return all_groups
+    
+    names = parquet_file.schema_arrow.names
+    if 'tpep_pickup_datetime' not in names:
+        return all_groups
+    
+    col_idx = names.index('tpep_pickup_datetime')
+    cutoff = pd.Timestamp(date_filter)
+    selected = []
+    
+    for i in all_groups:
+        stats = metadata.row_group(i).column(col_idx).statistics
+        # no statistics = we cant tell, so we have to read it
+        if stats is None or not stats.has_min_max or pd.Timestamp(stats.min) < cutoff:
+            selected.append(i)
+    
+    return selected
+
+
+def reservoir_sample_batches(batches, k, seed=SAMPLE_SEED):
+    """
+    Uniform random sample of k rows from a stream of record batches.
+    
+    Vectorized reservoir sampling (algorithm R): row number i (0-based,
+    counted over all batches) replaces a random reservoir slot with
+    probability k/(i+1). Each batch is handled with numpy in one go, so
+    memory stays at k rows + one batch no matter how much is read.
+    
+    Returns:
+        pyarrow Table with min(k, rows seen) rows
+    """
+    rng = np.random.default_rng(seed)
+    reservoir = None
+    seen = 0
+    
+    for batch in batches:
+        batch_rows = batch.num_rows
+        if batch_rows == 0:
+            continue
+        
+        table = pa.Table.from_batches([batch])
+        if reservoir is None:
+            reservoir = table.slice(0, 0)
+        
+        # which reservoir slot each row goes to (k or more = not kept)
+        positions = np.arange(seen, seen + batch_rows)
+        slots = np.where(positions < k, positions, rng.integers(0, positions + 1))
+        kept_rows = np.nonzero(slots < k)[0]
+        seen += batch_rows
+        
+        if len(kept_rows) == 0:
+            continue
+        
+        # if several rows in this batch hit the same slot the last one wins
+        kept_slots = slots[kept_rows]
+        _, last = np.unique(kept_slots[::-1], return_index=True)
+        last = len(kept_slots) - 1 - last
+        
+        current_rows = reservoir.num_rows
+        take_idx = np.arange(min(k, seen))
+        take_idx[kept_slots[last]] = current_rows + kept_rows[last]
+        
+        reservoir = pa.concat_tables([reservoir, table]).take(pa.array(take_idx))
+    
+    return reservoir
+
+
+def read_parquet_pushdown(filepath, columns=None, date_filter=None, sample_size=None,
+                          clustered_sample=False):
+    """
+    Read a parquet file with column, date and sampling pushdown.
+    
+    With sample_size, every row group left after the date statistics is
+    streamed through the reservoir, so the sample is uniform over all
+    matching trips.
+    
+    With clustered_sample, random row groups are read only until sample_size
+    * SAMPLE_OVERSAMPLE matching rows have been seen. Because TLC files are
+    written in roughly pickup order, that sample is a few random chunks of
+    the month, not a uniform one - only use it for quick experiments.
+    
+    Returns:
+        pandas DataFrame
+    """
+    parquet_file = pq.ParquetFile(filepath)
+    names = parquet_file.schema_arrow.names
+    read_columns = [col for col in columns if col in names] if columns else None
+    
+    row_groups = select_row_groups(parquet_file, date_filter)
+    skipped = parquet_file.metadata.num_row_groups - len(row_groups)
+    if skipped > 0:
+        log_message(f"Skipped {skipped} of {parquet_file.metadata.num_row_groups} row groups using date statistics")
+    
+    cutoff = pd.Timestamp(date_filter) if date_filter else None
+    
+    def filtered_batches(groups):
+        for batch in parquet_file.iter_batches(row_groups=groups, columns=read_columns):
+            if cutoff is not None:
+                pickup = batch.column(batch.schema.get_field_index('tpep_pickup_datetime'))
+                mask = pc.less(pickup, pa.scalar(cutoff.to_pydatetime(), type=pickup.type))
+                batch = batch.filter(mask)
+            yield batch
+    
+    if sample_size and not clustered_sample:
+        table = reservoir_sample_batches(filtered_batches(row_groups) if row_groups else [], sample_size)
+    elif sample_size:
+        # read random row groups one at a time until enough rows that pass the
+        # date filter went through the reservoir (counting raw rows here would
+        # come up short when the filter drops most of a row group)
+        rng = np.random.default_rng(SAMPLE_SEED)
+        rng.shuffle(row_groups)
+        target_rows = sample_size * SAMPLE_OVERSAMPLE
+        progress = {"groups": 0, "rows": 0}
+        
+        def sampled_groups_batches():
+            for i in row_groups:
+                if progress["rows"] >= target_rows:
+                    return
+                progress["groups"] += 1
+                for batch in filtered_batches([i]):
+                    progress["rows"] += batch.num_rows
+                    yield batch
+        
+        table = reservoir_sample_batches(sampled_groups_batches(), sample_size)
+        if progress["groups"] < len(row_groups):
+            # files are roughly in pickup order, so this is not uniform over
+            # the whole file - its a uniform sample of the row groups we read
+            log_message(f"Sample is row-group clustered: drawn from {progress['groups']} of "
+                        f"{len(row_groups)} row groups ({progress['rows']:,} matching rows)")
+    else:
+        batches = list(filtered_batches(row_groups)) if row_groups else []
+        table = pa.Table.from_batches(batches) if batches else None
+    
+    if table is None or table.num_rows == 0:
+        schema = parquet_file.schema_arrow
+        if read_columns:
+            schema = pa.schema([schema.field(col) for col in read_columns])
+        return schema.empty_table().to_pandas()
+    
+    return table.to_pandas()
+
+
 def load_zone_lookup(filepath):
     """
     Load the taxi zone lookup CSV file.
@@ -60,6 +281,37 @@ def load_zone_lookup(filepath):
     return zone_df
 
 
+def assign_zones_from_coordinates(df, geojson_path=ZONE_GEOJSON_FILE):
+    """
+    Add PULocationID / DOLocationID to older trip files (pre-2016) that only
+    have pickup/dropoff longitude and latitude.
+    
+    Coordinates outside every zone (0,0 GPS errors, outside NYC) get NaN,
+    so clean_missing_values drops them like any other missing location.
+    
+    Returns:
+        DataFrame with PULocationID and DOLocationID added
+    """
+    started = time.perf_counter()
+    index = load_zone_grid_index(geojson_path)
+    log_message(f"Zone grid index ready ({index['n_rows']}x{index['n_cols']} cells, "
+                f"{len(index['boundary']):,} boundary cells) in {time.perf_counter() - started:.1f}s")
+    df = df.copy()
+    
+    for prefix, id_col in (('pickup', 'PULocationID'), ('dropoff', 'DOLocationID')):
+        started = time.perf_counter()
+        zone_ids = assign_zone_ids(df[f'{prefix}_longitude'].to_numpy(), df[f'{prefix}_latitude'].to_numpy(), index)
+        elapsed = time.perf_counter() - started
+        
+        df[id_col] = pd.array(zone_ids, dtype='Float64').astype('Int64')
+        unmatched = int(np.isnan(zone_ids).sum())
+        rate = len(df) / elapsed if elapsed > 0 else 0
+        log_message(f"Assigned {id_col} from coordinates: {len(df) - unmatched:,} matched, "
+                    f"{unmatched:,} outside all zones ({rate:,.0f} points/s)")
+    
+    return df
+
+
 def merge_with_zones(trip_df, zone_df):
     """
     Merge trip data with zone lookup for both pickup and dropoff locations.
@@ -135,7 +387,7 @@ def clean_missing_values(df):
     return df_clean
 
 
-def remove_duplicates(df):
+def remove_duplicates(df, dedup_index=None):
     """
     Remove duplicate trip records from the dataset.
     
@@ -149,6 +401,14 @@ def remove_duplicates(df):
     This catches exact duplicates while preserving legitimate trips
     that happen to have similar characteristics.
     
+    If a dedup_index is given, trips that were already loaded from an
+    earlier file (TLC re-deliveries) are removed too. The index is only
+    read here - the loader adds hashes once trips are actually inserted.
+    
+    Args:
+        df: DataFrame with trip data
+        dedup_index: Optional DedupIndex of trips already in the database
+    
     Returns:
         DataFrame with duplicates removed
     """
@@ -156,13 +416,7 @@ def remove_duplicates(df):
     
     # Define subset of columns to check for duplicates
     # These uniquely identify a trip (same time, locations, and fare)
-    duplicate_cols = [
-        'tpep_pickup_datetime',
-        'tpep_dropoff_datetime',
-        'PULocationID',
-        'DOLocationID',
-        'total_amount'
-    ]
+    duplicate_cols = DUPLICATE_KEY_COLUMNS
     
     # Check which columns exist in the dataframe
     available_cols = [col for col in duplicate_cols if col in df.columns]
@@ -180,6 +434,19 @@ def remove_duplicates(df):
     else:
         log_message("No duplicate records found")
     
+    # Check against trips loaded from earlier files
+    if dedup_index is not None and len(dedup_index) > 0:
+        if has_key_columns(df):
+            already_loaded = dedup_index.contains(compute_trip_hashes(df))
+            loaded_count = int(already_loaded.sum())
+            if loaded_count > 0:
+                df = df[~already_loaded].copy()
+                log_message(f"Removed {loaded_count:,} trips already loaded from earlier files")
+            else:
+                log_message(f"No overlap with {len(dedup_index):,} previously loaded trips")
+        else:
+            log_message("Warning: Missing key columns, skipped cross-file duplicate check")
+    
     return df
 
 
@@ -294,7 +561,7 @@ def create_derived_features(df):
     return df
 
 
-def run_data_pipeline(sample_size=None, date_filter=None, output_format='csv'):
+def run_data_pipeline(sample_size=None, date_filter=None, output_format='csv', clustered_sample=False):
     """
     Main function to run the complete data cleaning pipeline.
     
@@ -302,14 +569,18 @@ def run_data_pipeline(sample_size=None, date_filter=None, output_format='csv'):
         sample_size: Number of rows to sample (e.g., 50000). None = use all.
         date_filter: Date string to filter before (e.g., '2019-01-08'). None = no filter.
         output_format: 'csv' or 'parquet'. Default 'csv' for smaller files.
+        clustered_sample: Sample from a few random row groups instead of the
+            whole file (faster, not uniform - see read_parquet_pushdown)
     
     Steps:
-    1. Load trip data (parquet or csv)
-    2. Optional: Sample or filter data
+    1. Load trip data (parquet or csv), only the columns we use
+       (older files: assign zone IDs from pickup/dropoff coordinates)
+    2. Optional: Sample or filter data (pushed down into the parquet reader,
+       filter applies first then the sample is taken from what's left)
     3. Load zone lookup
     4. Merge datasets
     5. Clean missing values
-    6. Remove duplicates
+    6. Remove duplicates (also against trips loaded from earlier files)
     7. Remove outliers
     8. Create derived features
     9. Save processed data
@@ -350,17 +621,17 @@ def run_data_pipeline(sample_size=None, date_filter=None, output_format='csv'):
     
     try:
         # Step 1: Load data
-        trip_df = load_trip_data(trip_file)
+        # Optional: Sample or filter data to reduce size - done inside the
+        # reader so we dont read the parts we would throw away anyway
+        trip_df = load_trip_data(trip_file, date_filter=date_filter, sample_size=sample_size,
+                                 clustered_sample=clustered_sample)
         
-        # Optional: Sample or filter data to reduce size
-        if sample_size and len(trip_df) > sample_size:
-            trip_df = trip_df.sample(n=sample_size, random_state=42)
-            log_message(f"Sampled {sample_size:,} rows from dataset")
-        
-        if date_filter:
-            original_count = len(trip_df)
-            trip_df = trip_df[trip_df['tpep_pickup_datetime'] < date_filter]
-            log_message(f"Filtered to trips before {date_filter}: {len(trip_df):,} rows (removed {original_count - len(trip_df):,})")
+        # Older files have coordinates instead of zone IDs - look them up
+        if 'PULocationID' not in trip_df.columns and 'pickup_longitude' in trip_df.columns:
+            if not os.path.exists(ZONE_GEOJSON_FILE):
+                log_message(f"ERROR: {ZONE_GEOJSON_FILE} is needed to assign zones from coordinates")
+                return
+            trip_df = assign_zones_from_coordinates(trip_df)
         
         zone_df = load_zone_lookup(zone_lookup_file)
         
@@ -370,8 +641,9 @@ def run_data_pipeline(sample_size=None, date_filter=None, output_format='csv'):
         # Step 3: Clean missing values
         cleaned_df = clean_missing_values(merged_df)
         
-        # Step 4: Remove duplicates
-        deduped_df = remove_duplicates(cleaned_df)
+        # Step 4: Remove duplicates (within this file and against earlier loads)
+        dedup_index = DedupIndex.load()
+        deduped_df = remove_duplicates(cleaned_df, dedup_index)
         
         # Step 5: Remove outliers
         outlier_free_df = remove_outliers(deduped_df)
@@ -0,0 +1,131 @@
+# =============================================================================
+# Persistent Duplicate Index
+# =============================================================================
+# TLC sometimes re-delivers overlapping trips across monthly files, so checking
+# for duplicates inside one DataFrame is not enough. This keeps a sorted array
+# of 64-bit hashes (one per trip already loaded) next to the database, so new
+# files can be checked against everything loaded before without re-reading
+# the old data.
+#
+# Size: 8 bytes per trip (~24 MB for a 3M trip month)
+# Lookup: O(b log n) per batch of b trips using numpy searchsorted
+# =============================================================================
+
+import os
+
+import numpy as np
+import pandas as pd
+
+DEDUP_INDEX_PATH = os.path.join(os.path.dirname(__file__), '..', 'database', 'trip_dedup_index.npy')
+
+# Same columns remove_duplicates uses - these identify a unique trip
+DUPLICATE_KEY_COLUMNS = [
+    'tpep_pickup_datetime',
+    'tpep_dropoff_datetime',
+    'PULocationID',
+    'DOLocationID',
+    'total_amount'
+]
+
+
+def to_epoch_ns(values):
+    """Datetimes (any unit) or datetime strings -> int64 nanoseconds since epoch."""
+    return pd.to_datetime(values).astype('datetime64[ns]').astype('int64').to_numpy()
+
+
+def compute_trip_hashes(df):
+    """
+    Hash the duplicate key columns of every row into one uint64 per trip.
+
+    The key columns are normalized first so the same trip gives the same hash
+    whether it comes from the cleaner (datetime dtype, floats) or from the
+    cleaned CSV the loader reads (strings, ints):
+    - datetimes -> int64 nanoseconds (TLC parquet files load as
+      datetime64[us] and the CSV as datetime64[ns], so convert the unit
+      before taking the integer or the same trip hashes differently)
+    - location IDs -> int64
+    - total_amount -> int64 cents
+
+    Args:
+        df: DataFrame containing all of DUPLICATE_KEY_COLUMNS
+
+    Returns:
+        numpy uint64 array with one hash per row (same order as df)
+    """
+    key = pd.DataFrame({
+        'pickup': to_epoch_ns(df['tpep_pickup_datetime']),
+        'dropoff': to_epoch_ns(df['tpep_dropoff_datetime']),
+        'pu': df['PULocationID'].fillna(-1).astype('int64').to_numpy(),
+        'do': df['DOLocationID'].fillna(-1).astype('int64').to_numpy(),
+        'cents': (df['total_amount'].astype('float64') * 100).round().fillna(-1).astype('int64').to_numpy()
+    })
+    return pd.util.hash_pandas_object(key, index=False).to_numpy(dtype=np.uint64)
+
+
+def has_key_columns(df):
+    """Check the DataFrame has every column needed to hash trips."""
+    return all(col in df.columns for col in DUPLICATE_KEY_COLUMNS)
+
+
+class DedupIndex:
+    """
+    Sorted, unique array of trip hashes persisted as a .npy file.
+
+    Usage:
+        index = DedupIndex.load()
+        hashes = compute_trip_hashes(df)
+        new_df = df[~index.contains(hashes)]
+        ...insert new_df...
+        index.add(hashes_of_inserted_rows)
+        index.save()
+    """
+
+    def __init__(self, hashes=None, path=DEDUP_INDEX_PATH):
+        self.path = path
+        if hashes is None:
+            hashes = np.empty(0, dtype=np.uint64)
+        self.hashes = np.unique(np.asarray(hashes, dtype=np.uint64))
+
+    @classmethod
+    def load(cls, path=DEDUP_INDEX_PATH):
+        """Load the index from disk, or start an empty one if there is no file yet."""
+        if os.path.exists(path):
+            return cls(np.load(path), path=path)
+        return cls(path=path)
+
+    def save(self):
+        """Write the index to disk (via a temp file so a crash cant corrupt it)."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, self.hashes)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        """Forget every hash and delete the file (used when the database is recreated)."""
+        self.hashes = np.empty(0, dtype=np.uint64)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def contains(self, hashes):
+        """
+        Vectorized membership check.
+
+        Returns:
+            numpy bool array, True where the hash is already in the index
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(self.hashes) == 0 or len(hashes) == 0:
+            return np.zeros(len(hashes), dtype=bool)
+        pos = np.searchsorted(self.hashes, hashes)
+        pos[pos == len(self.hashes)] = 0
+        return self.hashes[pos] == hashes
+
+    def add(self, hashes):
+        """Merge new hashes into the index (stays sorted and unique)."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(hashes) > 0:
+            self.hashes = np.union1d(self.hashes, hashes)
+
+    def __len__(self):
+        return len(self.hashes)
@@ -8,16 +8,27 @@
 
 import sqlite3
 import pandas as pd
+import numpy as np
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+from dedup_index import DEDUP_INDEX_PATH, DedupIndex, compute_trip_hashes, has_key_columns
 
 DATABASE_PATH = os.path.join(os.path.dirname(__file__), '..', 'database', 'taxi_data.db')
 SCHEMA_PATH = os.path.join(os.path.dirname(__file__), '..', 'database', 'schema.sql')
 RAW_DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'raw')
 PROCESSED_DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'processed')
 
+# schema.sql only runs for new databases (or --reset), so anything added to
+# it later also goes here to reach databases that were created before
+SCHEMA_MIGRATIONS = [
+    "CREATE INDEX IF NOT EXISTS idx_pickup_datetime ON trips(pickup_datetime)"
+]
+
 
 def initialize_database():
-    """Create tables using schema.sql"""
+    """Create tables using schema.sql (wipes existing trips and the dedup index)"""
     conn = sqlite3.connect(DATABASE_PATH)
     
     with open(SCHEMA_PATH, 'r') as f:
@@ -26,9 +37,65 @@ def initialize_database():
     conn.executescript(schema_sql)
     conn.commit()
     conn.close()
+    
+    # schema.sql drops the trips table, so the old hashes are meaningless now
+    DedupIndex.load().reset()
     print("Database initialized!")
 
 
+def migrate_database():
+    """Bring an existing database up to date with schema.sql (safe to run every time)"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    for statement in SCHEMA_MIGRATIONS:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+
+
+def build_dedup_index_from_database(chunk_size=200000):
+    """
+    Rebuild the dedup index from the trips already in the database
+
+    Needed for databases loaded before the index existed - without it an
+    empty index would let a re-run insert every trip a second time.
+    """
+    dedup_index = DedupIndex()
+    conn = sqlite3.connect(DATABASE_PATH)
+    query = """
+        SELECT pickup_datetime AS tpep_pickup_datetime,
+               dropoff_datetime AS tpep_dropoff_datetime,
+               pickup_zone_id AS PULocationID,
+               dropoff_zone_id AS DOLocationID,
+               total_amount
+        FROM trips
+    """
+    for chunk in pd.read_sql_query(query, conn, chunksize=chunk_size):
+        dedup_index.add(compute_trip_hashes(chunk))
+    conn.close()
+
+    dedup_index.save()
+    print(f"Rebuilt dedup index from {len(dedup_index)} trips already in the database")
+    return dedup_index
+
+
+def load_dedup_index():
+    """Load the dedup index, rebuilding it if the database has trips but no index file"""
+    if os.path.exists(DEDUP_INDEX_PATH):
+        return DedupIndex.load()
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        has_trips = conn.execute("SELECT 1 FROM trips LIMIT 1").fetchone() is not None
+    except sqlite3.OperationalError:
+        has_trips = False  # no trips table yet
+    conn.close()
+
+    if has_trips:
+        print("No dedup index found for existing trips, building it from the database...")
+        return build_dedup_index_from_database()
+    return DedupIndex()
+
+
 def load_zones_data():
     """Load zone lookup into zones table - extract from cleaned data"""
     trips_file = os.path.join(PROCESSED_DATA_PATH, 'cleaned_taxi_data.csv')
@@ -75,7 +142,13 @@ def load_zones_data():
 
 
 def load_trips_data():
-    """Load cleaned trip data into trips table"""
+    """
+    Load cleaned trip data into trips table
+    
+    Trips already in the database (same key as a previous load) are skipped
+    using the persistent dedup index, so loading overlapping monthly files
+    doesnt create duplicates.
+    """
     trips_file = os.path.join(PROCESSED_DATA_PATH, 'cleaned_taxi_data.csv')
     
     if not os.path.exists(trips_file):
@@ -86,12 +159,28 @@ def load_trips_data():
     print("Loading trips... this might take a minute")
     df = pd.read_csv(trips_file)
     
+    # Skip trips that earlier files already loaded (checked for the whole file at once)
+    dedup_index = load_dedup_index()
+    hashes = None
+    if has_key_columns(df):
+        hashes = compute_trip_hashes(df)
+        already_loaded = dedup_index.contains(hashes)
+        if already_loaded.any():
+            print(f"Skipping {int(already_loaded.sum())} trips that are already in the database")
+            df = df[~already_loaded]
+            hashes = hashes[~already_loaded]
+    else:
+        print("WARNING: Missing key columns, cant check for duplicates against earlier loads")
+    
     conn = sqlite3.connect(DATABASE_PATH)
     
+    # remember which rows actually made it in so only those go in the index
+    inserted_mask = np.zeros(len(df), dtype=bool)
+    
     # Map columns from cleaned data to database schema
     # Rajveer's cleaned data has these columns we need
     inserted = 0
-    for _, row in df.iterrows():
+    for i, (_, row) in enumerate(df.iterrows()):
         try:
             conn.execute("""
                 INSERT INTO trips (
@@ -119,6 +208,7 @@ def load_trips_data():
                 int(row.get('pickup_hour', 0))
             ))
             inserted += 1
+            inserted_mask[i] = True
         except Exception as e:
             # Skip bad rows
             continue
@@ -129,6 +219,12 @@ def load_trips_data():
     
     conn.commit()
     conn.close()
+    
+    # only update the index after the commit so it never gets ahead of the database
+    if hashes is not None:
+        dedup_index.add(hashes[inserted_mask])
+        dedup_index.save()
+    
     print(f"Loaded {inserted} trips into database")
     return True
 
@@ -162,7 +258,12 @@ if __name__ == '__main__':
     print("=== Loading Data to Database ===\n")
     
     # Step 1: Create tables
-    initialize_database()
+    # Only on first run (or with --reset) - otherwise new monthly files get
+    # appended and the dedup index skips trips we already have
+    if '--reset' in sys.argv or not os.path.exists(DATABASE_PATH):
+        initialize_database()
+    else:
+        migrate_database()
     
     # Step 2: Load zones
     load_zones_data()
@@ -0,0 +1,233 @@
+# =============================================================================
+# Historical Replay Driver
+# =============================================================================
+# Streams the cleaned trips into the running backend in pickup-time order,
+# as if they were happening live, so we can test the dashboard (and measure
+# the backend) under a constant write load.
+#
+# - speed: 60 means one hour of trips is replayed in one minute,
+#   0 means send as fast as the backend can take them
+# - gaps with no trips (stray pickups from other years) are skipped instead
+#   of waited out
+# - every --interval seconds all trips whose pickup time has "happened"
+#   are sent as one micro-batch to POST /live/ingest
+# - --readers threads keep calling GET /live at the same time to measure
+#   read latency while writes are going on
+#
+# Usage (with the backend running in replay mode):
+#   cd backend && TAXI_REPLAY_MODE=1 python app.py
+#   python data_processing/replay.py --speed 60 --readers 2
+# =============================================================================
+
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+PROCESSED_DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'processed')
+
+DEFAULT_API_URL = 'http://localhost:5000'
+# biggest micro-batch we send in one request when running flat out
+MAX_BATCH_SIZE = 5000
+
+
+def load_replay_trips(filepath=None):
+    """
+    Load the cleaned trips sorted by pickup time.
+
+    Returns:
+        dict of numpy arrays: pickup_time (epoch seconds), pickup_zone_id,
+        fare_amount, total_amount
+    """
+    if filepath is None:
+        filepath = os.path.join(PROCESSED_DATA_PATH, 'cleaned_taxi_data.csv')
+        if not os.path.exists(filepath):
+            filepath = os.path.join(PROCESSED_DATA_PATH, 'cleaned_taxi_data.parquet')
+
+    columns = ['tpep_pickup_datetime', 'PULocationID', 'fare_amount', 'total_amount']
+    if filepath.endswith('.parquet'):
+        df = pd.read_parquet(filepath, columns=columns)
+    else:
+        df = pd.read_csv(filepath, usecols=columns, parse_dates=['tpep_pickup_datetime'])
+
+    df = df.sort_values('tpep_pickup_datetime', kind='stable')
+
+    return {
+        # timedelta division works for any unit (parquet loads as us, csv as ns)
+        'pickup_time': ((df['tpep_pickup_datetime'] - pd.Timestamp(0)) // pd.Timedelta('1s')).to_numpy(dtype='int64'),
+        'pickup_zone_id': df['PULocationID'].astype('int64').to_numpy(),
+        'fare_amount': df['fare_amount'].astype('float64').to_numpy(),
+        'total_amount': df['total_amount'].astype('float64').to_numpy()
+    }
+
+
+def post_json(url, payload):
+    """POST json and return the decoded response"""
+    body = json.dumps(payload).encode('utf-8')
+    req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(req) as res:
+        return json.loads(res.read())
+
+
+def percentile(values, pct):
+    return float(np.percentile(values, pct)) if values else 0.0
+
+
+def read_loop(api_url, stop_event, latencies):
+    """keep calling GET /live until told to stop, recording each latency in ms"""
+    levels = ['borough', 'zone']
+    i = 0
+    while not stop_event.is_set():
+        url = f"{api_url}/live?level={levels[i % 2]}&window={15 if i % 4 < 2 else 60}"
+        started = time.perf_counter()
+        with urllib.request.urlopen(url) as res:
+            res.read()
+        latencies.append((time.perf_counter() - started) * 1000)
+        i += 1
+
+
+class ReplayClock:
+    """
+    Replay time = first pickup + wall seconds * speed, plus skipped gaps.
+
+    Monthly TLC files contain a few stray pickups years before the rest
+    (2002, 2009...). Without skipping, the driver would send the first one
+    and then wait years of replay time for the next, so whenever the next
+    pickup is more than max_gap replay seconds ahead we jump straight to it.
+    """
+
+    def __init__(self, start, speed, max_gap):
+        self.start = start
+        self.speed = speed
+        self.max_gap = max_gap
+        self.skipped = 0.0
+        self.gaps_skipped = 0
+
+    def now(self, elapsed):
+        return self.start + self.skipped + elapsed * self.speed
+
+    def skip_idle_gap(self, next_pickup, elapsed):
+        """jump forward to next_pickup if its more than max_gap away"""
+        gap = next_pickup - self.now(elapsed)
+        if gap > self.max_gap:
+            self.skipped += gap
+            self.gaps_skipped += 1
+
+
+def next_batch_end(pickup_times, sent, clock, elapsed):
+    """
+    Index after the last trip to send now (pickup_times is sorted).
+
+    Everything that "happened" by now in replay time, at most MAX_BATCH_SIZE.
+    """
+    clock.skip_idle_gap(pickup_times[sent], elapsed)
+    end = int(np.searchsorted(pickup_times, clock.now(elapsed), side='right'))
+    return min(end, sent + MAX_BATCH_SIZE)
+
+
+def replay(trips, api_url=DEFAULT_API_URL, speed=60.0, interval=0.1, readers=1):
+    """
+    Send trips to the backend at `speed` x real time.
+
+    Returns:
+        dict with ingest throughput and read/write latency percentiles
+    """
+    try:
+        post_json(f"{api_url}/live/reset", {})
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            raise SystemExit("Backend has no /live/reset - start it with TAXI_REPLAY_MODE=1")
+        raise
+
+    pickup_times = trips['pickup_time']
+    total_trips = len(pickup_times)
+    if total_trips == 0:
+        print("No trips to replay")
+        return {}
+
+    stop_event = threading.Event()
+    read_latencies = []
+    reader_threads = [
+        threading.Thread(target=read_loop, args=(api_url, stop_event, read_latencies), daemon=True)
+        for _ in range(readers)
+    ]
+    for t in reader_threads:
+        t.start()
+
+    write_latencies = []
+    sent = 0
+    # one sleep interval of replay time is the most we ever wait for a trip
+    clock = ReplayClock(pickup_times[0], speed, interval * speed)
+    started = time.perf_counter()
+    next_report = started + 5
+
+    try:
+        while sent < total_trips:
+            if speed > 0:
+                end = next_batch_end(pickup_times, sent, clock, time.perf_counter() - started)
+            else:
+                end = min(sent + MAX_BATCH_SIZE, total_trips)
+
+            if end > sent:
+                batch = {col: values[sent:end].tolist() for col, values in trips.items()}
+                batch_started = time.perf_counter()
+                post_json(f"{api_url}/live/ingest", batch)
+                write_latencies.append((time.perf_counter() - batch_started) * 1000)
+                sent = end
+
+            now = time.perf_counter()
+            if now >= next_report:
+                print(f"  sent {sent:,}/{total_trips:,} trips ({sent / (now - started):,.0f} trips/s)")
+                next_report = now + 5
+
+            if speed > 0 and sent < total_trips:
+                time.sleep(interval)
+    finally:
+        stop_event.set()
+        for t in reader_threads:
+            t.join()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "trips": sent,
+        "seconds": round(elapsed, 2),
+        "trips_per_second": round(sent / elapsed, 1),
+        "batches": len(write_latencies),
+        "idle_gaps_skipped": clock.gaps_skipped,
+        "write_p50_ms": round(percentile(write_latencies, 50), 2),
+        "write_p95_ms": round(percentile(write_latencies, 95), 2),
+        "write_p99_ms": round(percentile(write_latencies, 99), 2),
+        "reads": len(read_latencies),
+        "read_p50_ms": round(percentile(read_latencies, 50), 2),
+        "read_p95_ms": round(percentile(read_latencies, 95), 2),
+        "read_p99_ms": round(percentile(read_latencies, 99), 2)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay cleaned trips into the backend's /live windows")
+    parser.add_argument('--file', help="cleaned trips file (default: data/processed/cleaned_taxi_data.*)")
+    parser.add_argument('--url', default=DEFAULT_API_URL, help="backend url")
+    parser.add_argument('--speed', type=float, default=60.0, help="times real time, 0 = as fast as possible")
+    parser.add_argument('--interval', type=float, default=0.1, help="seconds between micro-batches")
+    parser.add_argument('--readers', type=int, default=1, help="threads reading /live during the replay")
+    parser.add_argument('--limit', type=int, help="only replay the first N trips")
+    args = parser.parse_args()
+
+    trips = load_replay_trips(args.file)
+    if args.limit:
+        trips = {col: values[:args.limit] for col, values in trips.items()}
+
+    pace = f"{args.speed:g}x real time" if args.speed > 0 else "full speed"
+    print(f"=== Replaying {len(trips['pickup_time']):,} trips at {pace} ===\n")
+    stats = replay(trips, args.url, args.speed, args.interval, args.readers)
+
+    print("\n--- Replay Summary ---")
+    for key, value in stats.items():
+        print(f"{key}: {value}")
@@ -0,0 +1,22 @@
+# =============================================================================
+# Zone GeoJSON Helpers
+# =============================================================================
+# Shared by the cleaner's zone index (data_processing/zone_index.py) and the
+# backend's zone map (backend/zone_map.py), so both read taxi_zones.geojson
+# the same way.
+# =============================================================================
+
+
+def get_zone_id(properties):
+    """
+    Zone ID from a taxi_zones.geojson feature's properties.
+    
+    The geojson from NYC Open Data has used a few different key names.
+    
+    Returns:
+        int zone ID, or None if the feature has none
+    """
+    for key in ('LocationID', 'location_id', 'locationid', 'OBJECTID', 'objectid'):
+        if key in properties and properties[key] is not None:
+            return int(float(properties[key]))
+    return None
@@ -0,0 +1,308 @@
+# =============================================================================
+# Zone Grid Index
+# =============================================================================
+# Older trip files (pre-2016) only have pickup/dropoff coordinates, not zone
+# IDs. Testing every point against all 263 zone polygons is far too slow, so
+# this cuts the city into a grid once:
+# - most cells are fully inside one zone -> a lookup table answers them
+# - cells with a zone boundary keep only the edges inside that cell, so a
+#   point there is tested against a handful of edges instead of thousands
+#
+# The index is pickled to data/processed and rebuilt when the geojson changes.
+# =============================================================================
+
+import json
+import os
+import pickle
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+from zone_geojson import get_zone_id
+
+ZONE_INDEX_CACHE = os.path.join(os.path.dirname(__file__), '..', 'data', 'processed', 'zone_grid_index.pkl')
+# ~500m cells - small enough that most cells are fully inside one zone
+ZONE_GRID_CELL_DEGREES = 0.005
+
+
+def read_zone_polygons(geojson_path):
+    """
+    Read taxi_zones.geojson into a list of (zone_id, edges) per polygon.
+    
+    MultiPolygons become one entry per part. edges is an (E, 4) array of
+    x1, y1, x2, y2 for every ring (holes included - the even-odd rule
+    handles them).
+    """
+    with open(geojson_path, 'r') as f:
+        geojson = json.load(f)
+    
+    polygons = []
+    for feature in geojson.get('features', []):
+        zone_id = get_zone_id(feature.get('properties') or {})
+        geometry = feature.get('geometry')
+        if zone_id is None or not geometry:
+            continue
+        
+        if geometry['type'] == 'Polygon':
+            parts = [geometry['coordinates']]
+        elif geometry['type'] == 'MultiPolygon':
+            parts = geometry['coordinates']
+        else:
+            continue
+        
+        for rings in parts:
+            edges = []
+            for ring in rings:
+                pts = np.asarray(ring, dtype=float)[:, :2]
+                if len(pts) < 3:
+                    continue
+                if not np.array_equal(pts[0], pts[-1]):
+                    pts = np.vstack([pts, pts[:1]])
+                edges.append(np.hstack([pts[:-1], pts[1:]]))
+            if edges:
+                polygons.append((zone_id, np.vstack(edges)))
+    
+    return polygons
+
+
+def points_in_polygon(px, py, edges, chunk_size=2000):
+    """
+    Even-odd ray casting for many points against one polygon's edges.
+    
+    Returns:
+        numpy bool array, True where the point is inside
+    """
+    x1, y1, x2, y2 = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+    inside = np.zeros(len(px), dtype=bool)
+    
+    # chunk the points so the (points x edges) arrays stay small
+    for start in range(0, len(px), chunk_size):
+        cx = px[start:start + chunk_size, None]
+        cy = py[start:start + chunk_size, None]
+        straddles = (y1 > cy) != (y2 > cy)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x1 + (cy - y1) * (x2 - x1) / (y2 - y1)
+        crossings = straddles & (cx < x_cross)
+        inside[start:start + chunk_size] = crossings.sum(axis=1) % 2 == 1
+    
+    return inside
+
+
+def count_segment_crossings(cx, cy, px, py, edges):
+    """
+    How many edges the segment from (cx, cy) to each point (px, py) crosses.
+    
+    Orientation test, with 0 counted as "right of" so a segment that passes
+    exactly through a vertex is counted once, not twice.
+    """
+    x1, y1, x2, y2 = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+    px = px[:, None]
+    py = py[:, None]
+    
+    # which side of each edge the cell center and the points are on
+    side_c = ((x2 - x1) * (cy - y1) - (y2 - y1) * (cx - x1)) > 0
+    side_p = ((x2 - x1) * (py - y1) - (y2 - y1) * (px - x1)) > 0
+    # which side of the center->point segment each edge end is on
+    side_a = ((px - cx) * (y1 - cy) - (py - cy) * (x1 - cx)) > 0
+    side_b = ((px - cx) * (y2 - cy) - (py - cy) * (x2 - cx)) > 0
+    
+    return ((side_c != side_p) & (side_a != side_b)).sum(axis=1)
+
+
+def grid_cell(values, origin, cell_size):
+    """
+    Grid column (or row) of each coordinate, as floats (NaN stays NaN).
+    
+    Both building the index and looking points up go through here - if the
+    two computed cells differently, a point on a grid line could land in a
+    cell that doesnt have the edges next to it.
+    """
+    return np.floor((np.asarray(values, dtype=float) - origin) / cell_size)
+
+
+def build_zone_grid_index(geojson_path, cell_size=ZONE_GRID_CELL_DEGREES):
+    """
+    Build the spatial index used by assign_zone_ids.
+    
+    The area is cut into square cells:
+    - "interior" cells have no zone boundary in them, so every point in the
+      cell is in the same zone (or none) -> stored in cell_zone
+    - "boundary" cells store, for each polygon with an edge in the cell,
+      whether the cell center is inside it plus only the edges in the cell.
+      A point is inside if center_inside XOR (the segment center->point
+      crosses an odd number of those edges)
+    
+    Returns:
+        dict (also what gets cached to disk)
+    """
+    polygons = read_zone_polygons(geojson_path)
+    if not polygons:
+        raise ValueError(f"No zone polygons found in {geojson_path}")
+    
+    all_edges = np.vstack([edges for _, edges in polygons])
+    min_x = min(all_edges[:, 0].min(), all_edges[:, 2].min())
+    min_y = min(all_edges[:, 1].min(), all_edges[:, 3].min())
+    max_x = max(all_edges[:, 0].max(), all_edges[:, 2].max())
+    max_y = max(all_edges[:, 1].max(), all_edges[:, 3].max())
+    n_cols = int((max_x - min_x) // cell_size) + 1
+    n_rows = int((max_y - min_y) // cell_size) + 1
+    
+    def cell_range(lo, hi, origin, count):
+        first = np.clip(grid_cell(lo, origin, cell_size), 0, count - 1).astype(np.int64)
+        last = np.clip(grid_cell(hi, origin, cell_size), 0, count - 1).astype(np.int64)
+        return first, last
+    
+    def cell_centers(cells):
+        rows, cols = np.divmod(cells, n_cols)
+        return min_x + (cols + 0.5) * cell_size, min_y + (rows + 0.5) * cell_size
+    
+    # Step 1: which cells every edge touches (using the edge's bounding box)
+    boundary = {}
+    boundary_cells = set()
+    for poly_idx, (zone_id, edges) in enumerate(polygons):
+        c0, c1 = cell_range(np.minimum(edges[:, 0], edges[:, 2]), np.maximum(edges[:, 0], edges[:, 2]), min_x, n_cols)
+        r0, r1 = cell_range(np.minimum(edges[:, 1], edges[:, 3]), np.maximum(edges[:, 1], edges[:, 3]), min_y, n_rows)
+        
+        cell_ids = []
+        edge_ids = []
+        # most edges are short and sit in one cell - handle those in one go
+        single = (c0 == c1) & (r0 == r1)
+        cell_ids.append(r0[single] * n_cols + c0[single])
+        edge_ids.append(np.nonzero(single)[0])
+        for e in np.nonzero(~single)[0]:
+            rows, cols = np.meshgrid(np.arange(r0[e], r1[e] + 1), np.arange(c0[e], c1[e] + 1), indexing='ij')
+            cells = (rows * n_cols + cols).ravel()
+            cell_ids.append(cells)
+            edge_ids.append(np.full(len(cells), e))
+        cell_ids = np.concatenate(cell_ids)
+        edge_ids = np.concatenate(edge_ids)
+        
+        # group edge indexes by cell
+        order = np.argsort(cell_ids, kind='stable')
+        cell_ids = cell_ids[order]
+        edge_ids = edge_ids[order]
+        unique_cells, starts = np.unique(cell_ids, return_index=True)
+        ends = np.append(starts[1:], len(cell_ids))
+        
+        cx, cy = cell_centers(unique_cells)
+        center_inside = points_in_polygon(cx, cy, edges)
+        
+        for i, cell in enumerate(unique_cells):
+            boundary.setdefault(int(cell), []).append(
+                (zone_id, bool(center_inside[i]), edges[edge_ids[starts[i]:ends[i]]])
+            )
+        boundary_cells.update(unique_cells.tolist())
+    
+    # Step 2: interior cells - test the center of every cell in each polygon's
+    # bounding box that has no boundary in it
+    cell_zone = np.zeros(n_rows * n_cols, dtype=np.int64)
+    is_boundary = np.zeros(n_rows * n_cols, dtype=bool)
+    is_boundary[list(boundary_cells)] = True
+    
+    for zone_id, edges in polygons:
+        c0, c1 = cell_range(np.array([edges[:, [0, 2]].min()]), np.array([edges[:, [0, 2]].max()]), min_x, n_cols)
+        r0, r1 = cell_range(np.array([edges[:, [1, 3]].min()]), np.array([edges[:, [1, 3]].max()]), min_y, n_rows)
+        rows, cols = np.meshgrid(np.arange(r0[0], r1[0] + 1), np.arange(c0[0], c1[0] + 1), indexing='ij')
+        cells = (rows * n_cols + cols).ravel()
+        cells = cells[~is_boundary[cells] & (cell_zone[cells] == 0)]
+        if len(cells) == 0:
+            continue
+        cx, cy = cell_centers(cells)
+        cell_zone[cells[points_in_polygon(cx, cy, edges)]] = zone_id
+    
+    return {
+        "source_mtime": os.path.getmtime(geojson_path),
+        "cell_size": cell_size,
+        "min_x": min_x,
+        "min_y": min_y,
+        "n_cols": n_cols,
+        "n_rows": n_rows,
+        "cell_zone": cell_zone,
+        "is_boundary": is_boundary,
+        "boundary": boundary
+    }
+
+
+def load_zone_grid_index(geojson_path, cache_path=ZONE_INDEX_CACHE, cell_size=ZONE_GRID_CELL_DEGREES):
+    """
+    Load the cached zone grid index, rebuilding it if the geojson changed
+    or a different cell size is asked for.
+    """
+    if os.path.exists(cache_path):
+        with open(cache_path, 'rb') as f:
+            index = pickle.load(f)
+        if index.get("source_mtime") == os.path.getmtime(geojson_path) and index.get("cell_size") == cell_size:
+            return index
+    
+    index = build_zone_grid_index(geojson_path, cell_size)
+    
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+    
+    return index
+
+
+def assign_zone_ids(lon, lat, index):
+    """
+    Find the zone for every (lon, lat) pair.
+    
+    1. Work out each point's grid cell (vectorized)
+    2. Points in interior cells get that cell's zone straight away
+    3. Points in boundary cells are grouped by cell and tested against only
+       the edges in that cell
+    
+    Returns:
+        float array of zone IDs, NaN where the point is in no zone
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    zones = np.full(len(lon), np.nan)
+    
+    cols = grid_cell(lon, index["min_x"], index["cell_size"])
+    rows = grid_cell(lat, index["min_y"], index["cell_size"])
+    valid = (np.isfinite(cols) & np.isfinite(rows) & (cols >= 0) & (rows >= 0)
+             & (cols < index["n_cols"]) & (rows < index["n_rows"]))
+    
+    point_idx = np.nonzero(valid)[0]
+    cells = (rows[valid] * index["n_cols"] + cols[valid]).astype(np.int64)
+    
+    # Step 2: interior cells
+    cell_zone = index["cell_zone"][cells]
+    interior = cell_zone > 0
+    zones[point_idx[interior]] = cell_zone[interior]
+    
+    # Step 3: boundary cells - sort so each cell's points are next to each other
+    boundary = index["boundary"]
+    check = index["is_boundary"][cells]
+    check_idx = point_idx[check]
+    check_cells = cells[check]
+    
+    order = np.argsort(check_cells, kind='stable')
+    check_idx = check_idx[order]
+    check_cells = check_cells[order]
+    unique_cells, starts = np.unique(check_cells, return_index=True)
+    ends = np.append(starts[1:], len(check_cells))
+    
+    size = index["cell_size"]
+    for cell, start, end in zip(unique_cells.tolist(), starts, ends):
+        idx = check_idx[start:end]
+        row, col = divmod(cell, index["n_cols"])
+        cx = index["min_x"] + (col + 0.5) * size
+        cy = index["min_y"] + (row + 0.5) * size
+        px = lon[idx]
+        py = lat[idx]
+        
+        unassigned = np.ones(len(idx), dtype=bool)
+        for zone_id, center_inside, edges in boundary[cell]:
+            crossings = count_segment_crossings(cx, cy, px, py, edges)
+            inside = unassigned & (center_inside != (crossings % 2 == 1))
+            zones[idx[inside]] = zone_id
+            unassigned &= ~inside
+            if not unassigned.any():
+                break
+    
+    return zones
@@ -74,6 +74,9 @@ CREATE INDEX idx_dropoff_zone ON trips(dropoff_zone_id);
 -- composite index for when we filter by hour AND zone together
 CREATE INDEX idx_hour_and_zone ON trips(pickup_hour, pickup_zone_id);
 
+-- for the date range filters on /trips and /export
+CREATE INDEX idx_pickup_datetime ON trips(pickup_datetime);
+
 
 -- ================================================
 -- WHY I DESIGNED IT THIS WAY (for documentation)
@@ -55,6 +55,17 @@ async function fetchAvgFareByHour() {
     }
 }
 
+async function fetchZoneMap() {
+    try {
+        const res = await fetch(API_URL + '/zones/map');
+        if (!res.ok) throw new Error('Failed to fetch');
+        return await res.json();
+    } catch (err) {
+        console.error('Error getting zone map:', err);
+        return null;
+    }
+}
+
 async function fetchTopZones() {
     try {
         const res = await fetch(API_URL + '/top-zones?n=10');
@@ -253,25 +264,56 @@ async function init() {
     renderTopZonesChart(zonesData);
     
     // setup the map
-    initMap();
+    await initMap();
     
     console.log('done!');
 }
 
 // ==================
-// map stuff - shows nyc with markers for busy zones
+// map stuff - colours each zone by number of pickups
+// falls back to the hotspot markers if the zone map isnt available
 // ==================
 
-function initMap() {
-    // create map centered on manhattan
-    const map = L.map('nyc-map').setView([40.7580, -73.9855], 12);
-    
-    // add the tile layer (the actual map images)
-    L.tileLayer('https://{s}.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}{r}.png', {
-        attribution: '&copy; OpenStreetMap contributors &copy; CARTO',
-        maxZoom: 19
+// darker red = more pickups
+function getZoneColor(count, maxCount) {
+    if (!count) return '#2a2a3a';
+    const ratio = Math.sqrt(count / maxCount); // sqrt so small zones still show up
+    if (ratio > 0.8) return '#e94560';
+    if (ratio > 0.6) return '#c73a52';
+    if (ratio > 0.4) return '#a32f44';
+    if (ratio > 0.2) return '#7d2536';
+    return '#521a28';
+}
+
+function renderZoneChoropleth(map, zoneData) {
+    let maxCount = 0;
+    for (let i = 0; i < zoneData.features.length; i++) {
+        const count = zoneData.features[i].properties.trip_count;
+        if (count > maxCount) maxCount = count;
+    }
+
+    L.geoJSON(zoneData, {
+        style: function(feature) {
+            return {
+                fillColor: getZoneColor(feature.properties.trip_count, maxCount),
+                color: '#555',
+                weight: 0.5,
+                fillOpacity: 0.7
+            };
+        },
+        onEachFeature: function(feature, layer) {
+            const p = feature.properties;
+            layer.bindPopup(
+                '<b>' + (p.zone_name || 'Zone ' + p.zone_id) + '</b><br>' +
+                (p.borough || '') + '<br>' +
+                p.trip_count.toLocaleString() + ' pickups' +
+                (p.average_fare ? '<br>Avg fare: $' + p.average_fare : '')
+            );
+        }
     }).addTo(map);
-    
+}
+
+function renderHotspots(map) {
     // popular pickup locations in nyc (approximate coords)
     // these are some of the busiest zones based on our data
     const hotspots = [
@@ -302,14 +344,34 @@ function initMap() {
         }).addTo(map)
         .bindPopup('<b>' + spot.name + '</b><br>' + spot.trips.toLocaleString() + ' pickups');
     });
+}
+
+async function initMap() {
+    // create map centered on manhattan
+    const map = L.map('nyc-map').setView([40.7580, -73.9855], 12);
+    
+    // add the tile layer (the actual map images)
+    L.tileLayer('https://{s}.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}{r}.png', {
+        attribution: '&copy; OpenStreetMap contributors &copy; CARTO',
+        maxZoom: 19
+    }).addTo(map);
+    
+    const zoneData = await fetchZoneMap();
+    const hasZones = zoneData && zoneData.features && zoneData.features.length > 0;
+    
+    if (hasZones) {
+        renderZoneChoropleth(map, zoneData);
+    } else {
+        renderHotspots(map);
+    }
     
     // add a legend
     const legend = L.control({ position: 'bottomright' });
     legend.onAdd = function() {
         const div = L.DomUtil.create('div', 'map-legend');
         div.innerHTML = '<div style="background: rgba(0,0,0,0.7); padding: 10px; border-radius: 5px; color: white;">' +
-            '<b>Pickup Hotspots</b><br>' +
-            '<span style="color: #e94560;">●</span> Larger = More trips' +
+            '<b>' + (hasZones ? 'Pickups by Zone' : 'Pickup Hotspots') + '</b><br>' +
+            '<span style="color: #e94560;">●</span> ' + (hasZones ? 'Darker = Fewer trips' : 'Larger = More trips') +
             '</div>';
         return div;
     };
@@ -0,0 +1,50 @@
+# dedup hashes have to match no matter which file format the trips came from
+# (the cleaner reads TLC parquet, the loader reads the cleaned csv)
+
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'data_processing'))
+from dedup_index import DedupIndex, compute_trip_hashes
+
+
+def make_trips():
+    return pd.DataFrame({
+        'tpep_pickup_datetime': pd.to_datetime(['2024-01-01 00:57:55', '2024-01-01 03:12:00']),
+        'tpep_dropoff_datetime': pd.to_datetime(['2024-01-01 01:17:43', '2024-01-01 03:30:10']),
+        'PULocationID': [186, 140],
+        'DOLocationID': [79, 236],
+        'total_amount': [22.7, 18.75]
+    })
+
+
+def test_parquet_and_csv_round_trip_hash_the_same(tmp_path):
+    trips = make_trips()
+
+    # TLC files store timestamp[us], which pandas keeps as datetime64[us]
+    parquet_path = tmp_path / 'trips.parquet'
+    trips.astype({
+        'tpep_pickup_datetime': 'datetime64[us]',
+        'tpep_dropoff_datetime': 'datetime64[us]'
+    }).to_parquet(parquet_path, coerce_timestamps='us')
+    from_parquet = pd.read_parquet(parquet_path)
+
+    csv_path = tmp_path / 'trips.csv'
+    from_parquet.to_csv(csv_path, index=False)
+    from_csv = pd.read_csv(csv_path)
+
+    assert (compute_trip_hashes(from_parquet) == compute_trip_hashes(from_csv)).all()
+
+
+def test_index_finds_trips_loaded_from_other_format(tmp_path):
+    trips = make_trips()
+    csv_path = tmp_path / 'trips.csv'
+    trips.to_csv(csv_path, index=False)
+
+    index = DedupIndex(path=str(tmp_path / 'index.npy'))
+    index.add(compute_trip_hashes(pd.read_csv(csv_path)))
+
+    as_us = trips.astype({'tpep_pickup_datetime': 'datetime64[us]', 'tpep_dropoff_datetime': 'datetime64[us]'})
+    assert index.contains(compute_trip_hashes(as_us)).all()
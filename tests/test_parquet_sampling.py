@@ -0,0 +1,58 @@
+# parquet pushdown sampling in the cleaner
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'data_processing'))
+import data_cleaner
+from data_cleaner import read_parquet_pushdown
+
+
+@pytest.fixture(autouse=True)
+def log_to_tmp(tmp_path, monkeypatch):
+    # dont append test runs to data/cleaning_log.txt
+    monkeypatch.setattr(data_cleaner, 'LOG_FILE', str(tmp_path / 'cleaning_log.txt'))
+
+
+@pytest.fixture
+def month_file(tmp_path):
+    # 400k trips over january in pickup order, 8 row groups (like TLC files)
+    n = 400000
+    pickups = pd.date_range('2024-01-01', '2024-01-31 23:59', periods=n).astype('datetime64[us]')
+    df = pd.DataFrame({'tpep_pickup_datetime': pickups, 'fare_amount': np.arange(n, dtype=float)})
+    path = str(tmp_path / 'month.parquet')
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path, row_group_size=50000)
+    return path, df
+
+
+@pytest.mark.parametrize('clustered', [False, True])
+@pytest.mark.parametrize('sample_size', [20000, 200000])
+def test_filtered_sample_has_requested_size(month_file, sample_size, clustered):
+    path, df = month_file
+    cutoff = pd.Timestamp('2024-01-08')
+    eligible = int((df['tpep_pickup_datetime'] < cutoff).sum())
+
+    sample = read_parquet_pushdown(path, date_filter='2024-01-08', sample_size=sample_size,
+                                   clustered_sample=clustered)
+
+    assert len(sample) == min(sample_size, eligible)
+    assert (sample['tpep_pickup_datetime'] < cutoff).all()
+    assert sample['fare_amount'].is_unique
+
+
+def test_default_sample_covers_whole_month(month_file):
+    path, _ = month_file
+    sample = read_parquet_pushdown(path, sample_size=20000)
+
+    assert len(sample) == 20000
+    days = sample['tpep_pickup_datetime'].dt.day
+    assert days.min() == 1
+    assert days.max() == 31
+    # every day should get roughly 1/31 of the sample
+    assert days.value_counts().min() > 20000 / 31 * 0.7
@@ -0,0 +1,70 @@
+# replay driver: time conversion and the replay clock (no backend needed)
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'data_processing'))
+from replay import MAX_BATCH_SIZE, ReplayClock, load_replay_trips, next_batch_end
+
+
+def test_parquet_and_csv_give_same_epoch_seconds(tmp_path):
+    trips = pd.DataFrame({
+        'tpep_pickup_datetime': pd.to_datetime(['2024-01-01 12:40:00', '2024-01-01 12:41:30']),
+        'PULocationID': [161, 237],
+        'fare_amount': [12.1, 8.6],
+        'total_amount': [17.3, 12.0]
+    })
+
+    # TLC parquet is timestamp[us], the cleaned csv parses to datetime64[ns]
+    parquet_path = str(tmp_path / 'trips.parquet')
+    trips.astype({'tpep_pickup_datetime': 'datetime64[us]'}).to_parquet(parquet_path, coerce_timestamps='us')
+    csv_path = str(tmp_path / 'trips.csv')
+    trips.to_csv(csv_path, index=False)
+
+    from_parquet = load_replay_trips(parquet_path)['pickup_time']
+    from_csv = load_replay_trips(csv_path)['pickup_time']
+
+    assert from_parquet.tolist() == [1704112800, 1704112890]
+    assert from_csv.tolist() == from_parquet.tolist()
+
+
+def test_clock_skips_idle_gaps():
+    # one stray trip from 2009, then a normal january 2024 stream
+    stray = 1230768000
+    month = 1704067200 + np.arange(0, 3600, 2)
+    pickup_times = np.concatenate([[stray], month])
+
+    speed = 60.0
+    interval = 0.1
+    clock = ReplayClock(pickup_times[0], speed, interval * speed)
+
+    sent = 0
+    elapsed = 0.0
+    steps = 0
+    while sent < len(pickup_times):
+        end = next_batch_end(pickup_times, sent, clock, elapsed)
+        assert end - sent <= MAX_BATCH_SIZE
+        sent = max(sent, end)
+        elapsed += interval
+        steps += 1
+        assert steps < 10000, "replay clock got stuck in the gap"
+
+    # 1 hour at 60x is 1 minute of wall time = ~600 steps, the 15 year gap costs nothing
+    assert clock.gaps_skipped == 1
+    assert steps <= 3600 / speed / interval + 5
+
+
+def test_clock_does_not_skip_normal_spacing():
+    pickup_times = 1704067200 + np.arange(0, 600, 3)
+    clock = ReplayClock(pickup_times[0], 60.0, 6.0)
+
+    sent = 0
+    elapsed = 0.0
+    while sent < len(pickup_times):
+        sent = max(sent, next_batch_end(pickup_times, sent, clock, elapsed))
+        elapsed += 0.1
+
+    assert clock.gaps_skipped == 0
@@ -0,0 +1,103 @@
+# zone grid index vs brute force ray casting against every polygon
+
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'data_processing'))
+from zone_index import assign_zone_ids, load_zone_grid_index, points_in_polygon, read_zone_polygons
+
+
+@pytest.fixture
+def zones_geojson(tmp_path):
+    # 10x10 zones around nyc with jittered corners and densified edges, so
+    # edges cross grid lines at odd angles like the real coastline does
+    rng = np.random.default_rng(7)
+    n = 10
+    step = 0.02
+    xs = -74.1 + np.arange(n + 1)[:, None] * step + rng.uniform(-0.006, 0.006, (n + 1, n + 1))
+    ys = 40.6 + np.arange(n + 1)[None, :] * step + rng.uniform(-0.006, 0.006, (n + 1, n + 1))
+
+    features = []
+    for i in range(n):
+        for j in range(n):
+            corners = [(xs[i, j], ys[i, j]), (xs[i + 1, j], ys[i + 1, j]),
+                       (xs[i + 1, j + 1], ys[i + 1, j + 1]), (xs[i, j + 1], ys[i, j + 1])]
+            ring = []
+            for (ax, ay), (bx, by) in zip(corners, corners[1:] + corners[:1]):
+                for t in np.linspace(0, 1, 8, endpoint=False):
+                    ring.append([ax + (bx - ax) * t, ay + (by - ay) * t])
+            ring.append(ring[0])
+            features.append({
+                "type": "Feature",
+                "properties": {"LocationID": i * n + j + 1},
+                "geometry": {"type": "Polygon", "coordinates": [ring]}
+            })
+
+    path = tmp_path / 'taxi_zones.geojson'
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features}))
+    return str(path)
+
+
+def brute_force(px, py, polygons):
+    zones = np.full(len(px), np.nan)
+    for zone_id, edges in polygons:
+        zones[points_in_polygon(px, py, edges)] = zone_id
+    return zones
+
+
+def assert_same_zones(got, expected):
+    mismatches = ~((got == expected) | (np.isnan(got) & np.isnan(expected)))
+    assert int(mismatches.sum()) == 0
+
+
+def test_random_points_match_brute_force(zones_geojson, tmp_path):
+    index = load_zone_grid_index(zones_geojson, cache_path=str(tmp_path / 'index.pkl'))
+    polygons = read_zone_polygons(zones_geojson)
+
+    rng = np.random.default_rng(1)
+    px = rng.uniform(-74.15, -73.85, 50000)
+    py = rng.uniform(40.55, 40.85, 50000)
+
+    assert_same_zones(assign_zone_ids(px, py, index), brute_force(px, py, polygons))
+
+
+def test_points_on_grid_lines_match_brute_force(zones_geojson, tmp_path):
+    # building the index and looking points up have to agree on the cell of a
+    # point that sits exactly on a cell boundary
+    index = load_zone_grid_index(zones_geojson, cache_path=str(tmp_path / 'index.pkl'))
+    polygons = read_zone_polygons(zones_geojson)
+    size = index["cell_size"]
+
+    rng = np.random.default_rng(2)
+    cols = rng.integers(0, index["n_cols"], 3000)
+    rows = rng.integers(0, index["n_rows"], 3000)
+    width = index["n_cols"] * size
+    height = index["n_rows"] * size
+
+    px = np.concatenate([
+        index["min_x"] + cols * size,                                  # on vertical lines
+        rng.uniform(index["min_x"], index["min_x"] + width, 3000),
+        index["min_x"] + cols * size                                   # on grid corners
+    ])
+    py = np.concatenate([
+        rng.uniform(index["min_y"], index["min_y"] + height, 3000),
+        index["min_y"] + rows * size,                                  # on horizontal lines
+        index["min_y"] + rows * size
+    ])
+
+    got = assign_zone_ids(px, py, index)
+    assert_same_zones(got, brute_force(px, py, polygons))
+    assert np.isfinite(got).sum() > len(px) // 2
+
+
+def test_index_is_rebuilt_when_cell_size_changes(zones_geojson, tmp_path):
+    cache = str(tmp_path / 'index.pkl')
+    first = load_zone_grid_index(zones_geojson, cache_path=cache, cell_size=0.005)
+    second = load_zone_grid_index(zones_geojson, cache_path=cache, cell_size=0.01)
+
+    assert first["cell_size"] == 0.005
+    assert second["cell_size"] == 0.01
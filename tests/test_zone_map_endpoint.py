@@ -0,0 +1,73 @@
+# /zones/map compression, etags and 304s
+
+import gzip
+import json
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('TAXI_SKIP_WARMUP', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+import app as backend_app
+import zone_map
+from api_load_test import build_fixture_db
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'taxi_data.db')
+    build_fixture_db(db_path, 2000)
+
+    # one square zone per fixture zone id, big enough to be worth compressing
+    features = [{
+        "type": "Feature",
+        "properties": {"LocationID": zone_id},
+        "geometry": {"type": "Polygon", "coordinates": [[
+            [-74.0 + zone_id * 0.01, 40.7], [-73.99 + zone_id * 0.01, 40.7],
+            [-73.99 + zone_id * 0.01, 40.71], [-74.0 + zone_id * 0.01, 40.7]
+        ]]}
+    } for zone_id in range(1, 51)]
+    raw_path = str(tmp_path / 'taxi_zones.geojson')
+    simplified_path = str(tmp_path / 'taxi_zones_simplified.json')
+    with open(raw_path, 'w') as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+    monkeypatch.setattr(backend_app, 'DATABASE_PATH', db_path)
+    monkeypatch.setattr(backend_app, 'RAW_GEOJSON_PATH', raw_path)
+    monkeypatch.setattr(backend_app, 'SIMPLIFIED_GEOJSON_PATH', simplified_path)
+    monkeypatch.setattr(backend_app, 'load_simplified_geometry',
+                        lambda: zone_map.load_simplified_geometry(raw_path, simplified_path))
+    monkeypatch.setattr(backend_app, '_zone_map_cache', {"key": None, "bodies": {}, "etags": {}})
+    return backend_app.app.test_client()
+
+
+def test_gzip_and_identity_have_different_etags(client):
+    zipped = client.get('/zones/map', headers={'Accept-Encoding': 'gzip'})
+    plain = client.get('/zones/map', headers={'Accept-Encoding': 'identity'})
+
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Encoding' not in plain.headers
+    assert gzip.decompress(zipped.data) == plain.data
+    assert zipped.headers['ETag'] != plain.headers['ETag']
+    assert 'Accept-Encoding' in zipped.vary and 'Accept-Encoding' in plain.vary
+
+
+def test_gzip_q0_is_not_gzipped(client):
+    response = client.get('/zones/map', headers={'Accept-Encoding': 'gzip;q=0'})
+
+    assert 'Content-Encoding' not in response.headers
+    assert json.loads(response.data)["features"]
+
+
+def test_etag_only_matches_its_own_encoding(client):
+    zipped = client.get('/zones/map', headers={'Accept-Encoding': 'gzip'})
+    etag = zipped.headers['ETag']
+
+    again = client.get('/zones/map', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    other = client.get('/zones/map', headers={'If-None-Match': etag})
+
+    assert again.status_code == 304
+    assert other.status_code == 200
+    assert 'Content-Encoding' not in other.headers